@@ -0,0 +1,71 @@
+"""
+In-memory history of the transactions each address took part in.
+
+For every address, AddressHistory keeps the locations (block height and
+position in the block) of the transactions it sent or received, in chain
+order. Blocks only ever add to the end of these lists, so a page of an
+address's history is a slice: reading one costs the size of the page, not
+the length of the chain or of the address's history.
+
+A location is packed into one integer, height << 32 | position, and each
+address's locations live in an array('Q'), 8 bytes per entry.
+
+Pages are addressed by a cursor: the number of the address's entries older
+than the page. It stays valid as new blocks arrive, because they only add
+entries after it.
+"""
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+POSITION_BITS = 32
+POSITION_MASK = (1 << POSITION_BITS) - 1
+
+
+class AddressHistory:
+    def __init__(self):
+        self.locations: Dict[str, array] = {}
+
+    def __len__(self):
+        return len(self.locations)
+
+    def add_block(self, block):
+        """Record the block's transactions against their senders and recipients."""
+        locations = self.locations
+        base = block.index << POSITION_BITS
+        for position, tx in enumerate(block.transactions):
+            location = base | position
+            for address in (tx.sender, tx.recipient) if tx.sender != tx.recipient else (tx.sender,):
+                entries = locations.get(address)
+                if entries is None:
+                    entries = locations[address] = array('Q')
+                entries.append(location)
+
+    def remove_block(self, block):
+        """Undo add_block for the newest block added."""
+        locations = self.locations
+        for tx in reversed(block.transactions):
+            for address in (tx.recipient, tx.sender) if tx.sender != tx.recipient else (tx.sender,):
+                entries = locations[address]
+                entries.pop()
+                if not entries:
+                    del locations[address]
+
+    def count(self, address: str) -> int:
+        entries = self.locations.get(address)
+        return len(entries) if entries is not None else 0
+
+    def page(self, address: str, cursor: Optional[int] = None,
+             limit: int = 100) -> Tuple[List[Tuple[int, int]], Optional[int]]:
+        """
+        Up to `limit` (height, position) locations for `address`, newest
+        first, starting just before `cursor` (from the newest if None).
+        Returns (locations, cursor of the next page or None at the end).
+        """
+        entries = self.locations.get(address)
+        if entries is None:
+            return [], None
+        end = len(entries) if cursor is None else max(0, min(cursor, len(entries)))
+        start = max(0, end - limit)
+        page = [(location >> POSITION_BITS, location & POSITION_MASK)
+                for location in reversed(entries[start:end])]
+        return page, start if start > 0 else None
@@ -1,28 +1,114 @@
-from flask import Flask, request, jsonify, render_template
-from blockchain import Blockchain, Transaction
+from flask import Flask, Response, request, jsonify, render_template
+from blockchain import Blockchain, Transaction, pack_signature
+from mempool import Mempool, MempoolError
+from mempool_journal import MempoolJournal
+from block_store import BlockStore
+from chain_index import ChainIndex
 from consensus import ProofOfWork, TendermintBFT, ProofOfStake
+from mining import MiningJobManager
+from signatures import SignatureVerifier, SignatureCache
+from keys import PublicKeyCache
+from wallets import Wallets
+from codec import CodecError, MAX_STR16
 import json
 import os
+import time
+import threading
+from contextlib import nullcontext
 
 app = Flask(__name__)
 
-# Global blockchain instance (not thread-safe for real usage)
-blockchain = Blockchain()
+# Blocks are kept on disk here so the chain survives restarts.
+# Set CHAIN_DATA_DIR to an empty string to keep the chain in memory only.
+CHAIN_DATA_DIR = os.environ.get("CHAIN_DATA_DIR", "chaindata")
+# "always", "interval" or "never"; see block_store.py
+BLOCK_STORE_FSYNC = os.environ.get("BLOCK_STORE_FSYNC", "interval")
+
+block_store = BlockStore(os.path.join(CHAIN_DATA_DIR, "blocks"), fsync_policy=BLOCK_STORE_FSYNC) \
+    if CHAIN_DATA_DIR else None
+
+# SQLite lookup index next to the block store; set CHAIN_INDEX=0 to disable
+CHAIN_INDEX = os.environ.get("CHAIN_INDEX", "1") != "0"
+
+chain_index = ChainIndex(os.path.join(CHAIN_DATA_DIR, "index.sqlite")) \
+    if CHAIN_DATA_DIR and CHAIN_INDEX else None
+
+# How many of the newest blocks keep undo records, i.e. how deep a reorg can go
+UNDO_DEPTH = int(os.environ.get("UNDO_DEPTH", 100))
+
+# Caps on the pending transactions; past them, the lowest fee rates are evicted
+MEMPOOL_MAX_COUNT = int(os.environ.get("MEMPOOL_MAX_COUNT", 50_000))
+MEMPOOL_MAX_BYTES = int(os.environ.get("MEMPOOL_MAX_BYTES", 32 * 1024 * 1024))
+# Pending transactions one sender may have, parked ones included
+MEMPOOL_MAX_PER_SENDER = int(os.environ.get("MEMPOOL_MAX_PER_SENDER", 1000))
+# Seconds a transaction may stay pending, and how often expired ones are swept
+MEMPOOL_TTL = float(os.environ.get("MEMPOOL_TTL", 3600))
+MEMPOOL_SWEEP_INTERVAL = float(os.environ.get("MEMPOOL_SWEEP_INTERVAL", 10))
+
+# Resubmitting a transaction mined in one of this many newest blocks is refused
+RECENT_TX_BLOCKS = int(os.environ.get("RECENT_TX_BLOCKS", 1000))
+
+# Threads that check the signatures of a new block (default: one per CPU)
+VERIFY_WORKERS = int(os.environ.get("VERIFY_WORKERS", os.cpu_count() or 1))
+# Verified signatures remembered between mempool admission and the block
+SIGNATURE_CACHE_SIZE = int(os.environ.get("SIGNATURE_CACHE_SIZE", 100_000))
+
+# Public keys loaded for signature checks, kept for the busiest senders
+KEY_CACHE_SIZE = int(os.environ.get("KEY_CACHE_SIZE", 10_000))
+
+# For demonstration, the node keeps custodial wallets and signs for them, so
+# the UI can send from a wallet by name. Their keys are kept next to the
+# chain, so pending transactions stay valid across restarts. In real usage,
+# each user would hold their own key and submit signed transactions.
+# Wallets are only created through /wallets/new, plus the one mining
+# rewards go to by default and those of the demo PoS validators (below).
+wallets = Wallets(os.path.join(CHAIN_DATA_DIR, "wallets") if CHAIN_DATA_DIR else None)
+DEFAULT_MINER = "miner_node"
+wallets.create(DEFAULT_MINER)
+
+signature_verifier = SignatureVerifier(PublicKeyCache(KEY_CACHE_SIZE), workers=VERIFY_WORKERS,
+                                       cache=SignatureCache(SIGNATURE_CACHE_SIZE))
+
+# Global blockchain instance
+blockchain = Blockchain(store=block_store, index=chain_index, undo_depth=UNDO_DEPTH,
+                        mempool=Mempool(MEMPOOL_MAX_COUNT, MEMPOOL_MAX_BYTES, MEMPOOL_TTL,
+                                        MEMPOOL_MAX_PER_SENDER),
+                        recent_blocks=RECENT_TX_BLOCKS, verifier=signature_verifier)
+
+# Pending transactions are journaled next to the chain and restored on startup
+mempool_journal = MempoolJournal(os.path.join(CHAIN_DATA_DIR, "mempool"),
+                                 fsync=BLOCK_STORE_FSYNC != "never") if CHAIN_DATA_DIR else None
+if mempool_journal is not None:
+    mempool_journal.restore(blockchain)
+
+
+def sweep_mempool():
+    """Expire pending transactions even while no blocks or new ones arrive."""
+    while True:
+        time.sleep(MEMPOOL_SWEEP_INTERVAL)
+        blockchain.expire_transactions()
+
+
+threading.Thread(target=sweep_mempool, name="mempool-sweeper", daemon=True).start()
 
 # Choose consensus: "pow", "bft", or "pos"
 CONSENSUS_MODE = os.environ.get("CONSENSUS_MODE", "pow")
 
-pow_consensus = ProofOfWork()
-bft_consensus = TendermintBFT(validators=["valA", "valB", "valC"])
-pos_consensus = ProofOfStake()  # Initialize PoS
+# Number of processes used for the PoW nonce search (1 = search in-process)
+MINING_WORKERS = int(os.environ.get("MINING_WORKERS", os.cpu_count() or 1))
 
-# For demonstration, let's create a single ephemeral key pair for signing
-# In real usage, each user would generate their own.
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import ec
+pow_consensus = ProofOfWork(workers=MINING_WORKERS)
+bft_consensus = TendermintBFT(validators=["valA", "valB", "valC"])
+# Validators are staked under wallet names (or addresses), and their block
+# rewards go to the wallet's address, so they can be spent. The demo
+# validators get wallets up front.
+pos_consensus = ProofOfStake(reward_address=wallets.resolve)
+for validator in pos_consensus.get_stakes():
+    if wallets.resolve(validator) is None:
+        wallets.create(validator)
 
-private_key = ec.generate_private_key(ec.SECP256R1())
-public_key = private_key.public_key()
+# PoW mining runs as background jobs so /mine returns immediately
+mining_jobs = MiningJobManager(pow_consensus, blockchain)
 
 @app.route("/")
 def index():
@@ -40,6 +126,133 @@ def get_chain():
         "consensus_mode": CONSENSUS_MODE
     }), 200
 
+@app.route("/chain/validate", methods=["POST"])
+def validate_chain():
+    """
+    Re-verifies every block across ?workers= processes (default and at
+    most: one per CPU) and reports the first invalid height and blocks/sec.
+    """
+    try:
+        workers = int(request.args.get("workers", os.cpu_count() or 1))
+    except ValueError:
+        return jsonify({"error": "Invalid workers"}), 400
+    if workers < 1:
+        return jsonify({"error": "Invalid workers"}), 400
+    return jsonify(blockchain.audit_chain(min(workers, os.cpu_count() or 1))), 200
+
+@app.route("/blocks/<int:index>/proof/<int:tx_index>", methods=["GET"])
+def get_transaction_proof(index, tx_index):
+    """
+    Returns a Merkle inclusion proof for one transaction of a block, along
+    with the block header it can be checked against. A light client hashes
+    the header to confirm the block hash, then runs
+    merkle.verify_transaction(Transaction.from_dict(transaction), proof, merkle_root).
+    """
+    if not 0 <= index < len(blockchain.chain):
+        return jsonify({"error": "Block not found"}), 404
+    block = blockchain.chain[index]
+    if not 0 <= tx_index < len(block.transactions):
+        return jsonify({"error": "Transaction not found"}), 404
+
+    return jsonify({
+        "block_index": block.index,
+        "block_hash": block.hash.hex(),
+        "header": block.header().hex(),
+        "merkle_root": block.merkle_root.hex(),
+        "tx_index": tx_index,
+        "transaction": block.transactions[tx_index].to_dict(),
+        "proof": block.inclusion_proof(tx_index)
+    }), 200
+
+@app.route("/blocks/<int:index>", methods=["GET"])
+def get_block(index):
+    """Returns the block at a given height."""
+    if not 0 <= index < len(blockchain.chain):
+        return jsonify({"error": "Block not found"}), 404
+    return jsonify({"block": blockchain.chain[index].to_dict()}), 200
+
+@app.route("/blocks/<int:index>/raw", methods=["GET"])
+def get_raw_block(index):
+    """
+    Returns the block at a given height in the binary encoding peers
+    exchange (see codec.py).
+    """
+    if not 0 <= index < len(blockchain.chain):
+        return jsonify({"error": "Block not found"}), 404
+    return Response(blockchain.chain[index].to_bytes(), mimetype="application/octet-stream")
+
+@app.route("/blocks/hash/<block_hash>", methods=["GET"])
+def get_block_by_hash(block_hash):
+    """Returns the block with a given hash."""
+    try:
+        block = blockchain.find_block_by_hash(bytes.fromhex(block_hash))
+    except ValueError:
+        return jsonify({"error": "Invalid block hash"}), 400
+    if not block:
+        return jsonify({"error": "Block not found"}), 404
+    return jsonify({"block": block.to_dict()}), 200
+
+def transaction_locations_json(locations):
+    return [{
+        "block_index": block.index,
+        "block_hash": block.hash.hex(),
+        "position": position,
+        "transaction": block.transactions[position].to_dict()
+    } for block, position in locations]
+
+@app.route("/transactions/<txid>", methods=["GET"])
+def get_transaction(txid):
+    """
+    Returns every occurrence of a transaction id on the chain (identical
+    reward transactions can appear in more than one block).
+    """
+    try:
+        locations = blockchain.find_transaction(bytes.fromhex(txid))
+    except ValueError:
+        return jsonify({"error": "Invalid transaction id"}), 400
+    if not locations:
+        return jsonify({"error": "Transaction not found"}), 404
+    return jsonify({"txid": txid, "occurrences": transaction_locations_json(locations)}), 200
+
+@app.route("/transactions/<role>/<address>", methods=["GET"])
+def get_address_transactions(role, address):
+    """
+    Returns the newest transactions sent (role = "sender") or received
+    (role = "recipient") by an address. ?limit= caps the count (default 100,
+    at most 1000).
+    """
+    if role not in ("sender", "recipient"):
+        return jsonify({"error": "Role must be 'sender' or 'recipient'"}), 404
+    try:
+        limit = min(int(request.args.get("limit", 100)), 1000)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    if limit < 1:
+        return jsonify({"error": "Invalid limit"}), 400
+    locations = blockchain.address_transactions(address, role, limit)
+    return jsonify({"address": address, "role": role,
+                    "transactions": transaction_locations_json(locations)}), 200
+
+@app.route("/address/<address>/transactions", methods=["GET"])
+def get_address_history(address):
+    """
+    Returns a page of the transactions an address sent or received, newest
+    first. ?limit= sets the page size (default 100, at most 1000); pass the
+    returned next_cursor as ?cursor= to get the next, older page.
+    """
+    try:
+        limit = min(int(request.args.get("limit", 100)), 1000)
+        cursor = request.args.get("cursor")
+        cursor = int(cursor) if cursor not in (None, "") else None
+    except ValueError:
+        return jsonify({"error": "Invalid cursor or limit"}), 400
+    if limit < 1 or (cursor is not None and cursor < 0):
+        return jsonify({"error": "Invalid cursor or limit"}), 400
+    locations, next_cursor = blockchain.address_history(address, cursor, limit)
+    return jsonify({"address": address,
+                    "transactions": transaction_locations_json(locations),
+                    "next_cursor": next_cursor}), 200
+
 @app.route("/transactions/new", methods=["POST"])
 def new_transaction():
     """
@@ -47,43 +260,183 @@ def new_transaction():
     {
       "sender": "...",
       "recipient": "...",
-      "amount": 5
+      "amount": 5,
+      "fee": 0.1,                 (optional)
+      "nonce": 3,                 (optional)
+      "signature": [r, s],        (optional)
+      "public_key": "02ab..."     (with a signature)
     }
-    The transaction is signed using our ephemeral private_key for demonstration.
+    Unless a signature is given, the sender must be one of the node's
+    wallets, which signs the transaction for demonstration; the sender and
+    recipient may then be given by wallet name (see /wallets/new). A signed transaction (e.g. one a client
+    got back earlier, or signed with its own key) must carry the hex
+    compressed public key it was signed with, whose address is the
+    sender. Without a nonce, an unsigned transaction gets the sender's
+    next one after its pending transactions, and a signed one nonce 0 (as
+    in the transaction's to_dict form). Transactions that are already
+    pending or were mined in the recent blocks are rejected with 409; a
+    nonce that was already used, or pending spending past the sender's
+    balance, with 400.
     """
     values = request.get_json()
     required = ["sender", "recipient", "amount"]
     if not all(k in values for k in required):
         return "Missing values", 400
+    if not isinstance(values["sender"], str) or not isinstance(values["recipient"], str):
+        return jsonify({"error": "Sender and recipient must be strings"}), 400
+    if max(len(values["sender"].encode()), len(values["recipient"].encode())) > MAX_STR16:
+        return jsonify({"error": f"Sender and recipient must be at most {MAX_STR16} bytes"}), 400
+    amount = values["amount"]
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not amount > 0:
+        return jsonify({"error": "Invalid amount"}), 400
+    fee = values.get("fee", 0)
+    if isinstance(fee, bool) or not isinstance(fee, (int, float)) or not fee >= 0:
+        return jsonify({"error": "Invalid fee"}), 400
+    nonce = values.get("nonce")
+    # Nonces are encoded as u64
+    if nonce is not None and (isinstance(nonce, bool) or not isinstance(nonce, int)
+                              or not 0 <= nonce < 2 ** 64):
+        return jsonify({"error": "Invalid nonce"}), 400
+    if values["sender"] == "NETWORK":
+        return jsonify({"error": "Rewards can only be created by consensus"}), 400
+    signature = values.get("signature")
+    public_key = None
+    if signature is not None:
+        try:
+            signature = pack_signature(*signature)
+        except (TypeError, ValueError, OverflowError, AttributeError):
+            return jsonify({"error": "Signature must be [r, s]"}), 400
+        try:
+            public_key = bytes.fromhex(values["public_key"])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "A signed transaction needs the hex public_key it was signed with"}), 400
+    # A signature covers the fields as they are; only unsigned ones resolve names
+    if signature is None:
+        sender = wallets.resolve(values["sender"]) or values["sender"]
+        recipient = wallets.resolve(values["recipient"])
+        if recipient is None:
+            return jsonify({"error": f"Unknown recipient {values['recipient']}: give an address or "
+                                     "the name of one of this node's wallets"}), 400
+    else:
+        sender, recipient = values["sender"], values["recipient"]
+    wallet = wallets.by_address(sender)
+    if signature is None and wallet is None:
+        return jsonify({"error": f"{sender} is not a wallet of this node; "
+                                 "submit the transaction signed, with its public_key"}), 400
+    balance = blockchain.state.balance(sender)
+    if balance < amount + fee:
+        return jsonify({"error": f"Insufficient balance: {values['sender']} has {balance}"}), 400
+
+    # Only one transfer at a time per wallet, so each gets its own next
+    # nonce. The chain lock is only taken for the nonce lookup, the
+    # duplicate check and the insert: add_transaction verifies the
+    # signature before taking it, so mining and commits go on meanwhile
+    with wallet.lock if signature is None else nullcontext():
+        if nonce is None:
+            nonce = blockchain.next_nonce(sender) if signature is None else 0
+        tx = Transaction(
+            sender=sender,
+            recipient=recipient,
+            amount=values["amount"],
+            signature=signature,
+            fee=fee,
+            nonce=nonce,
+            public_key=public_key
+        )
+
+        # Sign the transaction with the sender's custodial key
+        try:
+            if signature is None:
+                wallet.sign(tx)
+            txid = tx.txid  # encodes the transaction
+        except CodecError as e:
+            return jsonify({"error": str(e)}), 400
+        with blockchain.lock:
+            duplicate = txid in blockchain.mempool or txid in blockchain.recent
+        if duplicate:
+            return jsonify({"error": "Duplicate transaction", "txid": txid.hex()}), 409
+        try:
+            blockchain.add_transaction(tx)
+        except MempoolError as e:
+            return jsonify({"error": str(e)}), 400
+    # Group commit: the journal record goes to disk along with any others
+    # queued meanwhile; wait for it outside the locks
+    if mempool_journal is not None:
+        mempool_journal.wait()
+
+    response = {"message": "Transaction added successfully", "txid": tx.txid.hex(),
+                "transaction": tx.to_dict()}
+    return jsonify(response), 201
 
-    tx = Transaction(
-        sender=values["sender"],
-        recipient=values["recipient"],
-        amount=values["amount"]
-    )
+@app.route("/balance/<address>", methods=["GET"])
+def get_balance(address):
+    """Balance of an address (or one of the node's wallets) as of the chain tip."""
+    address = wallets.resolve(address) or address
+    return jsonify({
+        "address": address,
+        "balance": blockchain.state.balance(address),
+        "height": blockchain.state.height
+    }), 200
 
-    # Sign the transaction with our ephemeral key
-    tx.sign_transaction(private_key)
-    blockchain.add_transaction(tx)
+@app.route("/wallets", methods=["GET"])
+def get_wallets():
+    """The node's custodial wallets, with their balances."""
+    return jsonify({"wallets": [{**wallet.to_dict(), "balance": blockchain.state.balance(wallet.address)}
+                                for wallet in wallets]}), 200
 
-    response = {"message": "Transaction added successfully"}
-    return jsonify(response), 201
+@app.route("/wallets/new", methods=["POST"])
+def new_wallet():
+    """
+    Create a custodial wallet: {"name": "alice"}. Returns the existing one
+    if the name is taken.
+    """
+    values = request.get_json(silent=True) or {}
+    name = values.get("name")
+    if not isinstance(name, str):
+        return jsonify({"error": "Missing wallet name"}), 400
+    existing = wallets.get(name)
+    try:
+        wallet = wallets.create(name)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"wallet": wallet.to_dict()}), 200 if existing is not None else 201
 
-@app.route("/mine", methods=["GET"])
+@app.route("/mine", methods=["GET", "POST"])
 def mine():
     """
-    If in PoW mode, attempt to mine a new block. In BFT mode, do nothing.
+    If in PoW mode, start mining a new block in the background and return
+    the job id. Poll /mine/jobs/<job_id> for the result. In BFT mode, do
+    nothing.
     """
     if CONSENSUS_MODE != "pow":
         return jsonify({"message": "Mining is only available in PoW mode"}), 400
 
-    miner_address = request.args.get("miner", "miner_node")
-    new_block = pow_consensus.mine_block(blockchain, miner_address)
-    if new_block:
-        response = {"message": "New Block Mined", "block": new_block.to_dict()}
-        return jsonify(response), 200
-    else:
-        return jsonify({"message": "Mining failed"}), 400
+    # The reward goes to an address, or to one of the node's wallets by name
+    miner = request.args.get("miner", DEFAULT_MINER)
+    miner_address = wallets.resolve(miner)
+    if miner_address is None:
+        return jsonify({"message": f"Unknown miner {miner}: give an address or the name of one of "
+                                   "this node's wallets"}), 400
+    job, started = mining_jobs.start(miner_address)
+    if not started:
+        return jsonify({"message": "A mining job is already running", "job": job.to_dict()}), 409
+    return jsonify({"message": "Mining job started", "job": job.to_dict()}), 202
+
+@app.route("/mine/jobs/<job_id>", methods=["GET"])
+def mining_job_status(job_id):
+    """Returns the status of a mining job, including the block once mined."""
+    job = mining_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown mining job"}), 404
+    return jsonify({"job": job.to_dict()}), 200
+
+@app.route("/mine/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_mining_job(job_id):
+    """Asks a running mining job to stop."""
+    job = mining_jobs.cancel(job_id)
+    if not job:
+        return jsonify({"error": "Unknown mining job"}), 404
+    return jsonify({"message": "Cancellation requested", "job": job.to_dict()}), 200
 
 @app.route("/consensus_mode", methods=["POST"])
 def set_consensus_mode():
@@ -102,8 +455,45 @@ def set_consensus_mode():
 
 @app.route("/mempool", methods=["GET"])
 def get_mempool():
-    """Returns the list of pending transactions."""
-    return jsonify({"transactions": blockchain.current_transactions}), 200
+    """
+    Returns the pending transactions that can be mined, best fee rate first,
+    and the pool's usage. Transactions parked behind a missing nonce are
+    counted but not listed.
+    """
+    with blockchain.lock:
+        transactions = [tx.to_dict() for tx in blockchain.mempool.by_priority()]
+        return jsonify({
+            "transactions": transactions,
+            "count": len(blockchain.mempool),
+            "parked": len(blockchain.mempool) - len(transactions),
+            "bytes": blockchain.mempool.bytes,
+            "max_count": blockchain.mempool.max_count,
+            "max_bytes": blockchain.mempool.max_bytes,
+            "max_per_sender": blockchain.mempool.max_per_sender
+        }), 200
+
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    """
+    Node counters: chain height, pending transactions and what became of
+    them, and how often block checks found signatures already verified.
+    """
+    with blockchain.lock:
+        mempool = blockchain.mempool
+        verifier = blockchain.verifier
+        return jsonify({
+            "height": len(blockchain.chain) - 1,
+            "accounts": len(blockchain.state.balances),
+            "mempool": {
+                "count": len(mempool),
+                "bytes": mempool.bytes,
+                "ttl": mempool.ttl,
+                **mempool.counters
+            },
+            "signature_cache": verifier.cache.stats() if verifier is not None and verifier.cache is not None
+            else None,
+            "key_cache": verifier.keys.stats() if verifier is not None else None
+        }), 200
 
 @app.route("/bft/validators", methods=["GET"])
 def get_bft_validators():
@@ -116,7 +506,7 @@ def bft_propose():
     if CONSENSUS_MODE != "bft":
         return jsonify({"error": "Not in BFT mode"}), 400
     
-    if not blockchain.current_transactions:
+    if not len(blockchain.mempool):
         return jsonify({"message": "No pending transactions to propose."}), 200
 
     proposal = bft_consensus.propose_block(blockchain)
@@ -128,7 +518,7 @@ def bft_propose():
         "proposal": {
              "proposer": proposal['proposer'],
              "block_index": proposal['block'].index,
-             "block_hash": proposal['block'].hash
+             "block_hash": proposal['block'].hash.hex()
         }
     }), 200
 
@@ -195,6 +585,10 @@ def add_stake():
 
     if amount <= 0:
         return jsonify({"error": "Amount must be positive"}), 400
+    # Rewards are paid to the validator's address, so it must have one
+    if not isinstance(validator, str) or wallets.resolve(validator) is None:
+        return jsonify({"error": f"Unknown validator {validator}: give an address or the name of one "
+                                 "of this node's wallets"}), 400
 
     success = pos_consensus.add_stake(validator, amount)
     if success:
@@ -0,0 +1,90 @@
+"""
+Memory per transaction of an in-memory chain.
+
+Builds a chain of `--transactions` signed transactions (default 1M) twice:
+once in the dict layout blocks used to hold (a dict per transaction with a
+fresh address string per field and a tuple of two big ints for the
+signature, hex strings for hashes), and once as the Transaction and Block
+objects the chain holds now, decoded from the binary block encoding the
+way a node loads its stored chain. Reports the traced allocations per
+transaction for each.
+
+    python -m benchmarks.bench_memory [--transactions N] [--per-block N]
+"""
+import gc
+import time
+import argparse
+import tracemalloc
+from blockchain import Block, Transaction, pack_signature
+
+ADDRESSES = 1000
+
+
+def dict_chain(num_blocks, per_block):
+    """The old layout: nested dicts, hex hashes, (r, s) signature tuples."""
+    chain = []
+    for index in range(num_blocks):
+        transactions = []
+        for position in range(per_block):
+            i = index * per_block + position
+            transactions.append({
+                'sender': f"user{i % ADDRESSES}",
+                'recipient': f"user{(i + 1) % ADDRESSES}",
+                'amount': i % 100 + 1,
+                'signature': (2 ** 255 - i, 2 ** 254 + i)
+            })
+        chain.append({
+            'index': index, 'transactions': transactions, 'timestamp': time.time(),
+            'previous_hash': f"{index:064x}", 'nonce': 0, 'signatures': [],
+            'consensus_method': "pos", 'merkle_root': f"{index + 1:064x}",
+            'bits': 0, 'version': 1, 'hash': f"{index + 2:064x}"
+        })
+    return chain
+
+
+def object_chain(num_blocks, per_block):
+    """The current layout, decoded from stored block encodings."""
+    chain = []
+    for index in range(num_blocks):
+        transactions = [
+            Transaction(f"user{i % ADDRESSES}", f"user{(i + 1) % ADDRESSES}", i % 100 + 1,
+                        signature=pack_signature(2 ** 255 - i, 2 ** 254 + i))
+            for i in range(index * per_block, (index + 1) * per_block)
+        ]
+        block = Block(index=index, transactions=transactions, timestamp=time.time(),
+                      previous_hash=index.to_bytes(32, 'big'), consensus_method="pos")
+        block.hash = block.compute_hash()
+        chain.append(Block.from_bytes(block.to_bytes()))
+    return chain
+
+
+def traced_size(build):
+    gc.collect()
+    tracemalloc.start()
+    chain = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del chain
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--per-block", type=int, default=100)
+    args = parser.parse_args()
+    num_blocks = max(1, args.transactions // args.per_block)
+    total = num_blocks * args.per_block
+
+    print(f"{total:,} transactions in {num_blocks:,} blocks")
+    print(f"{'layout':>8} {'total':>12} {'bytes/tx':>10}")
+    sizes = {}
+    for name, build in (("dicts", dict_chain), ("objects", object_chain)):
+        sizes[name] = traced_size(lambda: build(num_blocks, args.per_block))
+        print(f"{name:>8} {sizes[name] / 2 ** 20:>10.1f}MB {sizes[name] / total:>10.0f}")
+    print(f"objects use {sizes['objects'] / sizes['dicts']:.0%} of the dict layout")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Hash-rate scaling of the parallel PoW nonce search.
+
+Searches a fixed number of nonces at a difficulty that can never be met
+(so every run does the same amount of work) and reports the hash rate for
+an increasing number of worker processes, then the single-process hash rate
+for blocks of different sizes.
+
+    python -m benchmarks.bench_mining [--nonces N] [--max-workers W]
+"""
+import argparse
+import os
+import time
+from blockchain import Block, Transaction
+from difficulty import target_to_bits
+from mining import ParallelMiner, search_range
+
+# Only a hash of 0 or 1 would do
+UNREACHABLE_BITS = target_to_bits(1)
+
+
+def sample_block(num_transactions=10):
+    transactions = [
+        Transaction(f"user{i}", f"user{i + 1}", i)
+        for i in range(num_transactions)
+    ]
+    return Block(index=1, transactions=transactions, timestamp=time.time(),
+                 previous_hash=bytes(32), consensus_method="pow",
+                 bits=UNREACHABLE_BITS)
+
+
+def measure(workers, nonces):
+    block = sample_block()
+    miner = ParallelMiner(workers, chunk_size=max(1, nonces // (workers * 8)))
+    try:
+        # Warm the pool so process start-up is not counted
+        miner.search(block, max_nonce=workers)
+        miner.search(block, max_nonce=nonces)
+        return miner.last_stats
+    finally:
+        miner.close()
+
+
+def measure_block_size(num_transactions, nonces):
+    """Single-process hash rate, including building the header prefix."""
+    block = sample_block(num_transactions)
+    started = time.perf_counter()
+    search_range(block.header_prefix(), block.target, 0, nonces)
+    return nonces / (time.perf_counter() - started)
+
+
+def worker_counts(max_workers):
+    counts = []
+    n = 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nonces", type=int, default=400_000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'workers':>8} {'hashes/s':>12} {'speedup':>8} {'efficiency':>10}")
+    for workers in worker_counts(args.max_workers):
+        stats = measure(workers, args.nonces)
+        rate = stats['hash_rate']
+        baseline = baseline or rate
+        speedup = rate / baseline
+        print(f"{workers:>8} {rate:>12,.0f} {speedup:>8.2f} {speedup / workers:>10.0%}")
+
+    print()
+    print(f"{'txs':>8} {'hashes/s':>12}")
+    for num_transactions in (0, 100, 5_000):
+        rate = measure_block_size(num_transactions, args.nonces)
+        print(f"{num_transactions:>8} {rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Block-interval stability under a changing hash rate.
+
+Simulates a PoW chain whose hash rate steps through several phases (miners
+joining and leaving). Each block interval is drawn from the exponential
+distribution a Poisson mining process produces for the current target and
+hash rate. The same schedule is run with a fixed target and with the
+retargeting DifficultyAdjuster, and the interval statistics of each phase
+are printed. Single intervals are exponential, so their spread is inherent;
+the summary instead measures how far the average of each RETARGET_INTERVAL
+window strays from the target block time, as the RMS of log2(average /
+target) so that blocks twice too fast and twice too slow count the same.
+
+    python -m benchmarks.bench_retarget [--blocks-per-phase N] [--seed S]
+"""
+import argparse
+import math
+import random
+import statistics
+from types import SimpleNamespace
+from difficulty import DifficultyAdjuster, RETARGET_INTERVAL, TARGET_BLOCK_TIME, \
+    bits_to_target, target_to_bits
+
+# Hash rate of each phase, relative to the rate the initial target is tuned for
+PHASES = [1, 4, 16, 2, 0.5, 8]
+
+
+def simulate(retarget, blocks_per_phase, seed):
+    rng = random.Random(seed)
+    # Tune the initial target so that a hash rate of 1.0 hits TARGET_BLOCK_TIME
+    base_rate = 1_000_000.0
+    initial_target = int(2 ** 256 / (base_rate * TARGET_BLOCK_TIME))
+    adjuster = DifficultyAdjuster(initial_bits=target_to_bits(initial_target),
+                                  pow_limit=2 ** 256 - 1)
+
+    now = 0.0
+    phases = []
+    for multiplier in PHASES:
+        hash_rate = base_rate * multiplier
+        intervals = []
+        for _ in range(blocks_per_phase):
+            bits = adjuster.next_bits()
+            target = bits_to_target(bits)
+            expected_hashes = 2 ** 256 / (target + 1)
+            interval = rng.expovariate(hash_rate / expected_hashes)
+            now += interval
+            intervals.append(interval)
+            if retarget:
+                adjuster.observe(SimpleNamespace(consensus_method="pow", timestamp=now, bits=bits))
+        phases.append((multiplier, intervals))
+    return phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--blocks-per-phase", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"target block time: {TARGET_BLOCK_TIME:.1f}s")
+    print(f"{'hash rate':>10} | {'fixed mean':>10} {'stdev':>8} | {'retarget mean':>13} {'stdev':>8}")
+    fixed = simulate(False, args.blocks_per_phase, args.seed)
+    adjusted = simulate(True, args.blocks_per_phase, args.seed)
+    for (multiplier, fixed_intervals), (_, adjusted_intervals) in zip(fixed, adjusted):
+        print(f"{multiplier:>9}x | {statistics.mean(fixed_intervals):>10.2f} "
+              f"{statistics.stdev(fixed_intervals):>8.2f} | "
+              f"{statistics.mean(adjusted_intervals):>13.2f} "
+              f"{statistics.stdev(adjusted_intervals):>8.2f}")
+
+    print()
+    for label, phases in (("fixed", fixed), ("retarget", adjusted)):
+        all_intervals = [i for _, intervals in phases for i in intervals]
+        windows = [statistics.mean(all_intervals[i:i + RETARGET_INTERVAL])
+                   for i in range(0, len(all_intervals) - RETARGET_INTERVAL + 1, RETARGET_INTERVAL)]
+        error = math.sqrt(statistics.mean(math.log2(w / TARGET_BLOCK_TIME) ** 2 for w in windows))
+        print(f"{label:>9}: mean interval {statistics.mean(all_intervals):.2f}s, "
+              f"variance {statistics.variance(all_intervals):.1f}, "
+              f"{RETARGET_INTERVAL}-block window RMS log2 error {error:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Small timing harness shared by the benchmark suite.
+
+Results are plain dicts so they can be written to JSON as they are:
+    {"name": ..., "params": {...}, "median": s, "min": s, "number": n, "repeat": r}
+where median and min are seconds per call.
+"""
+import gc
+import json
+import time
+import platform
+import statistics
+
+# A timed batch should take at least this long, so timer resolution and
+# call overhead don't dominate fast operations
+MIN_BATCH_TIME = 0.05
+MAX_BATCH_SIZE = 1 << 20
+
+
+def _time_batch(fn, number):
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        return time.perf_counter() - started
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def measure(fn, repeat=5, min_batch_time=MIN_BATCH_TIME):
+    """
+    Time `fn()`. The batch size is grown until one batch takes at least
+    `min_batch_time`, then `repeat` batches are timed.
+    Returns {"median", "min", "number", "repeat"} with per-call seconds.
+    """
+    number = 1
+    elapsed = _time_batch(fn, number)
+    while elapsed < min_batch_time and number < MAX_BATCH_SIZE:
+        # Aim a little past the minimum so we rarely need another round
+        number = min(MAX_BATCH_SIZE, max(number * 2, int(number * 1.2 * min_batch_time / max(elapsed, 1e-9))))
+        elapsed = _time_batch(fn, number)
+
+    per_call = [elapsed / number]
+    per_call += [_time_batch(fn, number) / number for _ in range(repeat - 1)]
+    return {
+        'median': statistics.median(per_call),
+        'min': min(per_call),
+        'number': number,
+        'repeat': repeat
+    }
+
+
+def result(name, params, timing, **extra):
+    """Build one result record."""
+    record = {'name': name, 'params': params}
+    record.update(timing)
+    record.update(extra)
+    return record
+
+
+def result_key(record):
+    """Identity of a result across runs: its name and parameters."""
+    return record['name'] + json.dumps(record['params'], sort_keys=True)
+
+
+def metadata():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'timestamp': time.time()
+    }
+
+
+def compare(results, baseline):
+    """
+    Compare results with a baseline run. Returns a list of
+    (record, baseline_median, ratio) for every result that has a baseline,
+    where ratio > 1 means slower than the baseline.
+    """
+    baseline_by_key = {result_key(r): r for r in baseline['results']}
+    comparisons = []
+    for record in results:
+        previous = baseline_by_key.get(result_key(record))
+        if previous and previous['median'] > 0:
+            comparisons.append((record, previous['median'], record['median'] / previous['median']))
+    return comparisons
+
+
+def format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
@@ -0,0 +1,578 @@
+"""
+Microbenchmark suite for the node's hot paths.
+
+Runs parameter sweeps over the core operations, prints a table, optionally
+writes the results as JSON and compares them against a stored baseline.
+Exits with status 1 when any result is slower than the baseline by more
+than the tolerance, so it can gate a deploy.
+
+    python -m benchmarks.suite                        # full sweeps
+    python -m benchmarks.suite --quick                # smaller sweeps
+    python -m benchmarks.suite --only mine,stake      # some groups only
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --save-baseline        # write the baseline
+    python -m benchmarks.suite --baseline benchmarks/baseline.json --tolerance 0.25
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from cryptography.hazmat.primitives.asymmetric import ec
+from blockchain import Block, Blockchain, Transaction, pack_signature
+from chain_index import ChainIndex
+from consensus import ProofOfWork, TendermintBFT
+from difficulty import DifficultyAdjuster, target_to_bits
+from mempool import Mempool
+from mempool_journal import MempoolJournal
+from template import build_block
+from codec import block_overhead
+from stake import StakeManager
+from state import AccountState
+from signatures import SignatureVerifier, SignatureCache
+from keys import PublicKeyCache, public_key_bytes, address_of, load_public_key
+from wallets import Wallets
+from benchmarks.harness import measure, result, compare, metadata, format_seconds
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def sample_transactions(count, signed=False, start=0):
+    """Transfers among 1000 users, each user's numbered with nonces from 0."""
+    return [
+        Transaction(f"user{i % 1000}", f"user{(i + 1) % 1000}", i % 100 + 1,
+                    signature=pack_signature(2 ** 255 - i, 2 ** 254 + i) if signed else None,
+                    nonce=i // 1000)
+        for i in range(start, start + count)
+    ]
+
+
+def signed_transfers(count, private_keys):
+    """Transfers signed in turn by each key, from its address, nonces from 0."""
+    senders = [address_of(public_key_bytes(key.public_key())) for key in private_keys]
+    transactions = []
+    for i in range(count):
+        tx = Transaction(senders[i % len(senders)], f"user{i % 1000}", i % 100 + 1,
+                         nonce=i // len(senders))
+        tx.sign_transaction(private_keys[i % len(private_keys)])
+        transactions.append(tx)
+    return transactions
+
+
+def build_chain(num_blocks, txs_per_block=1):
+    """A chain of PoS-style blocks (no mining needed), linked and hashed."""
+    blockchain = Blockchain()
+    previous = blockchain.get_last_block()
+    for index in range(1, num_blocks):
+        block = Block(index=index, transactions=sample_transactions(txs_per_block),
+                      timestamp=previous.timestamp + 1, previous_hash=previous.hash,
+                      consensus_method="pos")
+        block.hash = block.compute_hash()
+        blockchain.chain.append(block)
+        previous = block
+    return blockchain
+
+
+def bench_index_lookup(quick):
+    results = []
+    txs_per_block = 100
+    for total in (10_000, 100_000) + (() if quick else (1_000_000,)):
+        with tempfile.TemporaryDirectory() as directory:
+            blockchain = build_chain(total // txs_per_block, txs_per_block)
+            # Make every transaction unique so lookups have one answer
+            for block in blockchain.chain:
+                for position, tx in enumerate(block.transactions):
+                    tx.amount = block.index * txs_per_block + position
+            wanted = blockchain.chain[len(blockchain.chain) // 2].transactions[7].txid
+
+            # Without an index, lookups scan the chain
+            if total <= 100_000:
+                timing = measure(lambda: blockchain.find_transaction(wanted), repeat=3, min_batch_time=0)
+                results.append(result("chain.find_transaction.scan", {"transactions": total}, timing))
+
+            blockchain.index = ChainIndex(os.path.join(directory, "index.sqlite"))
+            blockchain.sync_index()
+            timing = measure(lambda: blockchain.find_transaction(wanted))
+            results.append(result("chain.find_transaction.index", {"transactions": total}, timing))
+            timing = measure(lambda: blockchain.address_transactions("user50", "sender", 20))
+            results.append(result("chain.address_transactions.index", {"transactions": total}, timing))
+            blockchain.index.close()
+
+            # The in-memory address history pages in time proportional to the page
+            for block in blockchain.chain[1:]:
+                blockchain.history.add_block(block)
+            timing = measure(lambda: blockchain.address_history("user50", None, 20))
+            results.append(result("chain.address_history", {"transactions": total}, timing))
+            cursor = blockchain.history.count("user50") // 2
+            timing = measure(lambda: blockchain.address_history("user50", cursor, 20))
+            results.append(result("chain.address_history", {"transactions": total, "cursor": "middle"}, timing))
+    return results
+
+
+def bench_compute_hash(quick):
+    results = []
+    for count in (0, 10, 100, 1_000) + (() if quick else (10_000,)):
+        block = Block(index=1, transactions=sample_transactions(count, signed=True),
+                      timestamp=time.time(), previous_hash=bytes(32))
+        block.compute_hash()
+        results.append(result("block.compute_hash", {"transactions": count},
+                              measure(block.compute_hash)))
+        # The part of hashing a new block that still grows with its size
+        results.append(result("block.compute_merkle_root", {"transactions": count},
+                              measure(block.compute_merkle_root, repeat=3)))
+    return results
+
+
+def bench_codec(quick):
+    results = []
+    for count in (1, 100) + (() if quick else (1_000, 10_000)):
+        block = Block(index=1, transactions=sample_transactions(count, signed=True),
+                      timestamp=time.time(), previous_hash=bytes(32), consensus_method="pow")
+        block.hash = block.compute_hash()
+        params = {"transactions": count}
+
+        encoded = block.to_bytes()
+        results.append(result("codec.encode_block", params, measure(block.to_bytes), size=len(encoded)))
+        results.append(result("codec.decode_block", params, measure(lambda: Block.from_bytes(encoded))))
+
+        # The JSON path it replaces, for comparison
+        as_json = json.dumps(block.to_dict(), sort_keys=True).encode()
+        results.append(result("json.encode_block", params,
+                              measure(lambda: json.dumps(block.to_dict(), sort_keys=True).encode()),
+                              size=len(as_json)))
+        results.append(result("json.decode_block", params,
+                              measure(lambda: Block.from_dict(json.loads(as_json)))))
+    return results
+
+
+def bench_mine(quick):
+    results = []
+    pow_consensus = ProofOfWork(workers=1)
+    for zero_bits in (8, 12) + (() if quick else (16,)):
+        blockchain = Blockchain()
+        blockchain.difficulty = DifficultyAdjuster(
+            initial_bits=target_to_bits(1 << (256 - zero_bits)), interval=10 ** 9,
+            pow_limit=2 ** 256 - 1)
+        # Mining is a random process: average over several blocks
+        repeat = 5 if quick else 15
+        timing = measure(lambda: pow_consensus.mine_block(blockchain, "bench"),
+                         repeat=repeat, min_batch_time=0)
+        results.append(result("pow.mine_block", {"zero_bits": zero_bits}, timing))
+    return results
+
+
+def bench_validate_chain(quick):
+    results = []
+    for length in (1_000, 10_000) + (() if quick else (100_000,)):
+        blockchain = build_chain(length)
+        timing = measure(lambda: blockchain.is_valid_chain(deep=True), repeat=3, min_batch_time=0)
+        results.append(result("blockchain.is_valid_chain", {"blocks": length, "deep": True}, timing,
+                              blocks_per_sec=length / timing['median']))
+
+        # Sealed blocks (as added to a real chain) cache what validation
+        # computes, so checking them again is cheap; a deep check recomputes
+        for block in blockchain.chain:
+            block.seal()
+
+        def check_sealed():
+            for block in blockchain.chain[1:]:
+                blockchain.is_valid_block(block)
+        check_sealed()
+        timing = measure(check_sealed, repeat=3, min_batch_time=0)
+        results.append(result("blockchain.is_valid_block", {"blocks": length, "sealed": True},
+                              timing, blocks_per_sec=length / timing['median']))
+
+        workers = os.cpu_count() or 1
+        timing = measure(lambda: blockchain.audit_chain(workers), repeat=3, min_batch_time=0)
+        results.append(result("blockchain.audit_chain", {"blocks": length, "workers": workers}, timing,
+                              blocks_per_sec=length / timing['median']))
+
+        # Incremental check: one new block since the last validated checkpoint
+        def add_and_validate():
+            tip = blockchain.get_last_block()
+            block = Block(index=tip.index + 1, transactions=sample_transactions(1),
+                          timestamp=tip.timestamp + 1, previous_hash=tip.hash, consensus_method="pos")
+            blockchain.chain.append(block)
+            block.hash = block.compute_hash()
+            blockchain.is_valid_chain()
+        results.append(result("blockchain.is_valid_chain", {"blocks": length, "deep": False},
+                              measure(add_and_validate, repeat=3)))
+    return results
+
+
+def bench_state(quick):
+    results = []
+    per_block = 100
+    for total in (10_000, 100_000) + (() if quick else (1_000_000,)):
+        blocks = []
+        for index in range(1, total // per_block + 1):
+            block = Block(index=index, transactions=sample_transactions(per_block, start=(index - 1) * per_block),
+                          timestamp=time.time(), previous_hash=bytes(32), consensus_method="pos")
+            blocks.append(block)
+
+        def replay():
+            state = AccountState()
+            # Start every address off with enough to cover its transfers
+            state.balances = {f"user{i}": 10 ** 12 for i in range(1000)}
+            for block in blocks:
+                state.apply_block(block)
+
+        timing = measure(replay, repeat=3, min_batch_time=0)
+        results.append(result("state.apply_block", {"transactions": total, "per_block": per_block}, timing,
+                              tx_per_sec=total / timing['median']))
+    return results
+
+
+def bench_reorg(quick):
+    results = []
+    per_block, depth = 100, 10
+    for accounts in (10_000, 100_000) + (() if quick else (1_000_000,)):
+        blockchain = Blockchain()
+        funding = {f"user{i}": 10 ** 12 for i in range(accounts)}
+        blockchain.state.balances.update(funding)
+        nonces = {}
+        for index in range(1, 201):
+            tip = blockchain.get_last_block()
+            transactions = []
+            for i in range(per_block):
+                sender = f"user{(index * per_block + i) % accounts}"
+                nonces[sender] = nonces.get(sender, -1) + 1
+                transactions.append(Transaction(sender, f"user{(index * per_block + i * 7919) % accounts}",
+                                                i + 1, nonce=nonces[sender]))
+            block = Block(index=index, transactions=transactions, timestamp=tip.timestamp + 1,
+                          previous_hash=tip.hash, consensus_method="pos")
+            block.hash = block.compute_hash()
+            blockchain.add_block(block)
+        params = {"accounts": accounts, "blocks": len(blockchain.chain)}
+
+        def reorg():
+            # Disconnect the last `depth` blocks and connect them again
+            fork = len(blockchain.chain) - 1 - depth
+            disconnected = blockchain.disconnect_to(fork)
+            for block in reversed(disconnected):
+                blockchain.add_block(block)
+
+        timing = measure(reorg, repeat=3)
+        results.append(result("blockchain.reorg", dict(params, depth=depth), timing))
+
+        # What a reorg costs without undo records: rebuild the state from scratch
+        def replay():
+            state = AccountState()
+            state.balances.update(funding)
+            for block in blockchain.chain:
+                state.apply_block(block)
+
+        timing = measure(replay, repeat=3, min_batch_time=0)
+        results.append(result("state.replay", params, timing))
+    return results
+
+
+def bench_mempool(quick):
+    results = []
+    batch = 1_000
+    for size in (1_000, 10_000) + (() if quick else (100_000,)):
+        transactions = sample_transactions(size, signed=True)
+        for i, tx in enumerate(transactions):
+            tx.fee = (i * 7919) % 1000
+        pool = Mempool(max_count=size + batch)
+        for tx in transactions:
+            pool.add(tx)
+        # From senders with nothing pending, so each is the head of its queue
+        arriving = [Transaction(f"payer{i}", f"user{i % 1000}", 1, fee=(i * 104729) % 1000,
+                                signature=pack_signature(2 ** 253 + i, 2 ** 252 + i))
+                    for i in range(batch)]
+        params = {"pending": size}
+
+        # A block's worth arrives and is then mined, at a steady pool size
+        def add_and_remove():
+            for tx in arriving:
+                pool.add(tx)
+            pool.remove_included(arriving)
+
+        timing = measure(add_and_remove, repeat=3)
+        results.append(result("mempool.add_remove", dict(params, batch=batch), timing,
+                              tx_per_sec=2 * batch / timing['median']))
+
+        def best_block():
+            for _ in zip(range(batch), pool.by_priority()):
+                pass
+
+        results.append(result("mempool.by_priority", dict(params, take=batch), measure(best_block, repeat=3)))
+
+        # Admission of a transaction that is already pending: one hash lookup
+        blockchain = Blockchain(mempool=pool)
+        blockchain.state.balances.update({f"user{i}": 10 ** 12 for i in range(1000)})
+        pending = transactions[size // 2]
+
+        def reject_duplicate():
+            try:
+                blockchain.add_transaction(pending)
+            except ValueError:
+                pass
+
+        results.append(result("blockchain.add_transaction.duplicate", params, measure(reject_duplicate)))
+
+        # A different transaction for a nonce that is already pending: one
+        # lookup in the sender's queue
+        conflicting = Transaction(pending.sender, pending.recipient, pending.amount + 1,
+                                  signature=pending.signature, nonce=pending.nonce)
+
+        def reject_conflict():
+            try:
+                blockchain.add_transaction(conflicting)
+            except ValueError:
+                pass
+
+        results.append(result("blockchain.add_transaction.nonce_conflict", params, measure(reject_conflict)))
+
+        # A template that fits about `batch` transactions, however many are pending
+        max_size = block_overhead("pow") + batch * len(transactions[0].to_bytes())
+        timing = measure(lambda: build_block(blockchain, "pow", max_size=max_size), repeat=3)
+        results.append(result("template.build_block", dict(params, max_bytes=max_size), timing))
+
+        # Nothing due: expiry only looks at the oldest entry
+        results.append(result("mempool.expire.none_due", params, measure(pool.expire)))
+
+        # A batch comes due: one step per expired entry
+        def expire_batch():
+            now = time.time()
+            for tx in arriving:
+                pool.add(tx, added=now)
+            pool.expire(now=now + pool.ttl)
+
+        timing = measure(expire_batch, repeat=3)
+        results.append(result("mempool.add_expire", dict(params, batch=batch), timing,
+                              tx_per_sec=batch / timing['median']))
+    return results
+
+
+def bench_journal(quick):
+    results = []
+    for pending in (1_000, 10_000) + (() if quick else (100_000,)):
+        with tempfile.TemporaryDirectory() as directory:
+            funding = {f"user{i}": 10 ** 12 for i in range(1000)}
+            blockchain = Blockchain(mempool=Mempool(max_count=10 ** 7, max_bytes=2 ** 40))
+            blockchain.state.balances.update(funding)
+            journal = MempoolJournal(directory)
+            journal.restore(blockchain)
+            transactions = iter(sample_transactions(pending + 100_000, signed=True))
+            for _ in range(pending):
+                blockchain.add_transaction(next(transactions))
+            journal.wait()
+
+            # One durable admission at a time: a write and an fsync each
+            def add_durably():
+                blockchain.add_transaction(next(transactions))
+                journal.wait()
+
+            timing = measure(add_durably, repeat=3, min_batch_time=0.05)
+            results.append(result("journal.add_and_wait", {"pending": pending}, timing))
+
+            # A burst queued before waiting shares one write and fsync
+            def add_burst():
+                for _ in range(100):
+                    blockchain.add_transaction(next(transactions))
+                journal.wait()
+
+            timing = measure(add_burst, repeat=3, min_batch_time=0)
+            results.append(result("journal.add_burst", {"pending": pending, "burst": 100}, timing,
+                                  tx_per_sec=100 / timing['median']))
+            journal.close()
+
+            def restore():
+                node = Blockchain(mempool=Mempool(max_count=10 ** 7, max_bytes=2 ** 40))
+                node.chain[0] = blockchain.chain[0]
+                node.state.balances.update(funding)
+                restored = MempoolJournal(directory)
+                restored.restore(node)
+                restored.close()
+
+            timing = measure(restore, repeat=3, min_batch_time=0)
+            results.append(result("journal.restore", {"pending": pending}, timing,
+                                  tx_per_sec=len(blockchain.mempool) / timing['median']))
+    return results
+
+
+def bench_transactions(quick):
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    public_key = private_key.public_key()
+    tx = Transaction("alice", "bob", 10)
+    tx.sign_transaction(private_key)
+    return [
+        result("transaction.sign_transaction", {}, measure(lambda: tx.sign_transaction(private_key))),
+        result("transaction.is_valid", {}, measure(lambda: tx.is_valid(public_key)))
+    ]
+
+
+def bench_signatures(quick):
+    private_keys = [ec.generate_private_key(ec.SECP256R1()) for _ in range(100)]
+    results = []
+    for count in (1_000, 10_000):
+        transactions = signed_transfers(count, private_keys)
+        for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+            verifier = SignatureVerifier(workers=workers)
+            timing = measure(lambda: verifier.first_invalid(transactions), repeat=3, min_batch_time=0)
+            results.append(result("signatures.verify_block", {"transactions": count, "workers": workers},
+                                  timing, tx_per_sec=count / timing['median']))
+
+            # A bad signature up front: the batch stops there
+            first = transactions[0]
+            forged = [Transaction(first.sender, "mallory", 10 ** 6, signature=first.signature,
+                                  public_key=first.public_key)] + transactions[1:]
+            timing = measure(lambda: verifier.first_invalid(forged), repeat=3, min_batch_time=0)
+            results.append(result("signatures.reject_block", {"transactions": count, "workers": workers},
+                                  timing))
+            verifier.close()
+
+    # A few busy senders: with the key cache, each key is loaded once and
+    # the rest is the bare verify cost, which preloaded keys show
+    transactions = signed_transfers(1_000, private_keys[:10])
+    loaded = {tx.public_key: load_public_key(tx.public_key) for tx in transactions}
+
+    def verify_preloaded():
+        for tx in transactions:
+            tx.is_valid(loaded[tx.public_key])
+
+    timing = measure(verify_preloaded, repeat=3, min_batch_time=0)
+    results.append(result("signatures.verify_senders", {"transactions": 1_000, "keys": "preloaded"},
+                          timing, tx_per_sec=1_000 / timing['median']))
+    for capacity in (0, 10_000):
+        keys = PublicKeyCache(capacity)
+        verifier = SignatureVerifier(keys, workers=1)
+        timing = measure(lambda: verifier.first_invalid(transactions), repeat=3, min_batch_time=0)
+        extra = {"hit_rate": round(keys.stats()["hit_rate"], 4)} if capacity else {}
+        results.append(result("signatures.verify_senders", {"transactions": 1_000, "key_cache": capacity},
+                              timing, tx_per_sec=1_000 / timing['median'], **extra))
+
+    # A BFT proposal of transfers admitted to the mempool first: with the
+    # signature cache, the proposal check finds every one already verified
+    for cached in (False, True):
+        cache = SignatureCache() if cached else None
+        verifier = SignatureVerifier(cache=cache)
+        blockchain = Blockchain(verifier=verifier)
+        for tx in transactions:
+            verifier.verify(tx, cached=False)
+        bft = TendermintBFT(validators=["valA", "valB", "valC"])
+        tip = blockchain.get_last_block()
+        block = Block(index=1, transactions=transactions, timestamp=time.time(), previous_hash=tip.hash,
+                      consensus_method="bft").seal()
+        timing = measure(lambda: bft.validate_proposal(blockchain, block, "valA"), repeat=3, min_batch_time=0)
+        extra = {"hit_rate": round(cache.stats()["hit_rate"], 4)} if cached else {}
+        results.append(result("bft.validate_proposal", {"transactions": len(transactions), "cached": cached},
+                              timing, **extra))
+        verifier.close()
+    return results
+
+
+def bench_stake(quick):
+    results = []
+    sizes = (10, 1_000, 100_000) + (() if quick else (1_000_000,))
+    for stakers in sizes:
+        manager = StakeManager()
+        for i in range(stakers):
+            manager.add_stake(f"validator{i}", 10.0 + i % 90, 0.0)
+        seed = b"\x42" * 32
+        timing = measure(lambda: manager.select_validator(seed), repeat=3)
+        results.append(result("stake.select_validator", {"stakers": stakers}, timing))
+    return results
+
+
+def bench_api(quick):
+    # Keep the node in memory: no block store, index, journal or wallet
+    # files, so a run never touches a real node's chaindata/
+    os.environ["CHAIN_DATA_DIR"] = ""
+    os.environ["CHAIN_INDEX"] = "0"
+    import app as node
+
+    results = []
+    client = node.app.test_client()
+    for length in (10, 100) + (() if quick else (1_000,)):
+        node.blockchain = build_chain(length, txs_per_block=5)
+        timing = measure(lambda: client.get("/chain"), repeat=3)
+        results.append(result("api.get_chain", {"blocks": length}, timing))
+
+    # Every post is a new transaction (the next nonce) from a custodial
+    # wallet; let them all in
+    node.wallets = Wallets()
+    node.blockchain = Blockchain(mempool=Mempool(max_per_sender=10 ** 7), verifier=SignatureVerifier(workers=1))
+    node.blockchain.state.balances[node.wallets.create("alice").address] = 10 ** 12
+    node.wallets.create("bob")
+    payload = {"sender": "alice", "recipient": "bob", "amount": 1}
+    timing = measure(lambda: client.post("/transactions/new", json=payload))
+    results.append(result("api.new_transaction", {}, timing))
+    return results
+
+
+GROUPS = {
+    "compute_hash": bench_compute_hash,
+    "codec": bench_codec,
+    "mine": bench_mine,
+    "validate_chain": bench_validate_chain,
+    "state": bench_state,
+    "reorg": bench_reorg,
+    "mempool": bench_mempool,
+    "journal": bench_journal,
+    "transactions": bench_transactions,
+    "signatures": bench_signatures,
+    "stake": bench_stake,
+    "api": bench_api,
+    "index": bench_index_lookup,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="smaller parameter sweeps")
+    parser.add_argument("--only", help="comma-separated groups to run: " + ", ".join(GROUPS))
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.20,
+                        help="allowed slowdown against the baseline (0.20 = 20%%)")
+    args = parser.parse_args()
+
+    selected = args.only.split(",") if args.only else list(GROUPS)
+    unknown = [name for name in selected if name not in GROUPS]
+    if unknown:
+        parser.error(f"unknown group(s): {', '.join(unknown)}")
+
+    results = []
+    for name in selected:
+        print(f"== {name}", flush=True)
+        for record in GROUPS[name](args.quick):
+            params = " ".join(f"{k}={v}" for k, v in record['params'].items())
+            extra = f"{record['size']} B" if 'size' in record else \
+                f"{record['tx_per_sec']:,.0f} tx/s" if 'tx_per_sec' in record else \
+                f"{record['hit_rate']:.1%} cache hits" if 'hit_rate' in record else ""
+            print(f"  {record['name']:<32} {params:<20} {format_seconds(record['median']):>10} {extra}", flush=True)
+            results.append(record)
+
+    run = {"meta": dict(metadata(), quick=args.quick), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = 0
+    print(f"\nAgainst baseline {args.baseline} (tolerance {args.tolerance:.0%}):")
+    for record, previous, ratio in compare(results, baseline):
+        regressed = ratio > 1 + args.tolerance
+        regressions += regressed
+        params = " ".join(f"{k}={v}" for k, v in record['params'].items())
+        print(f"  {'REGRESSION' if regressed else 'ok':<10} {record['name']:<32} {params:<20} "
+              f"{format_seconds(previous):>10} -> {format_seconds(record['median']):>10} ({ratio:.2f}x)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
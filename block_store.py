@@ -0,0 +1,241 @@
+"""
+Durable, append-only block storage.
+
+Blocks are appended as length-prefixed records to segment files
+(blk00000.dat, blk00001.dat, ...), starting a new segment once the current
+one reaches MAX_SEGMENT_SIZE. A separate index file holds one fixed-width
+(segment, offset) entry per height, so the entry for height h lives at byte
+h * INDEX_ENTRY.size. Appending a block is O(1), and reading any block by
+height is one positioned read into its segment.
+
+A record's payload is the block's canonical binary encoding (codec.py), and
+each record carries a CRC32 of its payload. On open, index entries whose
+record was not completely written (e.g. after a crash) are dropped, along
+with any unindexed bytes at the end of the last segment.
+
+fsync policies:
+- "always":   fsync data and index after every append (safest, slowest)
+- "interval": fsync at most every `fsync_interval` seconds
+- "never":    leave flushing to the operating system
+"""
+import os
+import time
+import zlib
+import struct
+import threading
+from blockchain import Block
+
+MAX_SEGMENT_SIZE = 128 * 1024 * 1024
+# Record header: payload length, CRC32 of payload
+RECORD_HEADER = struct.Struct(">II")
+# Index entry: segment number, offset of the record in that segment
+INDEX_ENTRY = struct.Struct(">IQ")
+INDEX_FILE = "index.dat"
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+class BlockStore:
+    """
+    Append-only block store in `directory`. Heights are dense: the block at
+    height h is the h-th block appended.
+    """
+
+    def __init__(self, directory, fsync_policy="interval", fsync_interval=1.0,
+                 max_segment_size=MAX_SEGMENT_SIZE):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync_policy must be one of {FSYNC_POLICIES}")
+        self.directory = directory
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.max_segment_size = max_segment_size
+        self._last_fsync = time.monotonic()
+        self._read_fds = {}  # segment number -> fd for reads
+        self._read_lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        index_path = os.path.join(directory, INDEX_FILE)
+        with open(index_path, "ab+") as f:
+            f.seek(0)
+            self._index = bytearray(f.read())
+        self._recover()
+
+        self._index_file = open(index_path, "ab")
+        self._segment = self._last_segment()
+        self._segment_file = open(self._segment_path(self._segment), "ab")
+
+    # --- paths and helpers ---
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"blk{segment:05d}.dat")
+
+    def _entry(self, height):
+        return INDEX_ENTRY.unpack_from(self._index, height * INDEX_ENTRY.size)
+
+    def _last_segment(self):
+        if len(self):
+            return self._entry(len(self) - 1)[0]
+        return 0
+
+    def _recover(self):
+        """Drop a torn tail left by an interrupted append."""
+        # A partially written index entry
+        del self._index[len(self._index) - len(self._index) % INDEX_ENTRY.size:]
+
+        # Index entries pointing at records that were not completely written
+        while len(self):
+            segment, offset = self._entry(len(self) - 1)
+            path = self._segment_path(segment)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if offset + RECORD_HEADER.size <= size:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    length, crc = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                    payload = f.read(length)
+                if len(payload) == length and zlib.crc32(payload) == crc:
+                    end = offset + RECORD_HEADER.size + length
+                    break
+            del self._index[-INDEX_ENTRY.size:]
+        else:
+            segment, end = 0, 0
+
+        # Bytes written after the last indexed record were never committed
+        later = segment + 1
+        while os.path.exists(self._segment_path(later)):
+            os.remove(self._segment_path(later))
+            later += 1
+        path = self._segment_path(segment)
+        if os.path.exists(path) and os.path.getsize(path) > end:
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        with open(os.path.join(self.directory, INDEX_FILE), "r+b") as f:
+            f.truncate(len(self._index))
+
+    def _maybe_fsync(self):
+        if self.fsync_policy == "never":
+            return
+        now = time.monotonic()
+        if self.fsync_policy == "interval" and now - self._last_fsync < self.fsync_interval:
+            return
+        self.sync()
+        self._last_fsync = now
+
+    def _read_at(self, segment, offset, size):
+        fd = self._read_fds.get(segment)
+        if fd is None:
+            with self._read_lock:
+                fd = self._read_fds.get(segment)
+                if fd is None:
+                    fd = os.open(self._segment_path(segment), os.O_RDONLY | getattr(os, "O_BINARY", 0))
+                    self._read_fds[segment] = fd
+        if hasattr(os, "pread"):
+            return os.pread(fd, size, offset)
+        with self._read_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.read(fd, size)
+
+    # --- public API ---
+
+    def __len__(self):
+        return len(self._index) // INDEX_ENTRY.size
+
+    def append(self, block: Block) -> int:
+        """Append a block and return its height."""
+        payload = block.to_bytes()
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        offset = self._segment_file.tell()
+        if offset > 0 and offset + len(record) > self.max_segment_size:
+            self._segment_file.flush()
+            os.fsync(self._segment_file.fileno())
+            self._segment_file.close()
+            self._segment += 1
+            self._segment_file = open(self._segment_path(self._segment), "ab")
+            offset = 0
+
+        self._segment_file.write(record)
+        # The data must be in the file before the index points at it
+        self._segment_file.flush()
+        entry = INDEX_ENTRY.pack(self._segment, offset)
+        self._index_file.write(entry)
+        self._index_file.flush()
+        self._index += entry
+        self._maybe_fsync()
+        return len(self) - 1
+
+    def truncate(self, height):
+        """
+        Drop every block at `height` and above (e.g. when the chain switches
+        to another branch), so the next append is at `height`.
+        """
+        if height >= len(self):
+            return
+        segment, offset = self._entry(height)
+        self._segment_file.close()
+        self._index_file.close()
+        with self._read_lock:
+            for number in [number for number in self._read_fds if number > segment]:
+                os.close(self._read_fds.pop(number))
+
+        del self._index[height * INDEX_ENTRY.size:]
+        later = segment + 1
+        while os.path.exists(self._segment_path(later)):
+            os.remove(self._segment_path(later))
+            later += 1
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        with open(index_path, "r+b") as f:
+            f.truncate(len(self._index))
+        with open(self._segment_path(segment), "r+b") as f:
+            f.truncate(offset)
+
+        self._index_file = open(index_path, "ab")
+        self._segment = segment
+        self._segment_file = open(self._segment_path(segment), "ab")
+        if self.fsync_policy != "never":
+            self.sync()
+
+    def read(self, height) -> Block:
+        """Read the block at `height`."""
+        if not 0 <= height < len(self):
+            raise IndexError(f"No block at height {height}")
+        segment, offset = self._entry(height)
+        # Read the header and a guess at the payload in one go; blocks are
+        # usually small enough that this is the only read
+        data = self._read_at(segment, offset, RECORD_HEADER.size + 4096)
+        length, crc = RECORD_HEADER.unpack_from(data)
+        if len(data) < RECORD_HEADER.size + length:
+            data += self._read_at(segment, offset + len(data), RECORD_HEADER.size + length - len(data))
+        payload = memoryview(data)[RECORD_HEADER.size:RECORD_HEADER.size + length]
+        if zlib.crc32(payload) != crc:
+            raise IOError(f"Corrupt block record at height {height}")
+        return Block.from_bytes(payload)
+
+    def iter_blocks(self, start=0):
+        """Stream blocks in height order, reading each segment sequentially."""
+        height = start
+        while height < len(self):
+            segment, offset = self._entry(height)
+            with open(self._segment_path(segment), "rb") as f:
+                f.seek(offset)
+                while height < len(self) and self._entry(height)[0] == segment:
+                    length, crc = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                    payload = f.read(length)
+                    if zlib.crc32(payload) != crc:
+                        raise IOError(f"Corrupt block record at height {height}")
+                    yield Block.from_bytes(payload)
+                    height += 1
+
+    def sync(self):
+        """Force appended blocks and index entries to disk."""
+        self._segment_file.flush()
+        os.fsync(self._segment_file.fileno())
+        self._index_file.flush()
+        os.fsync(self._index_file.fileno())
+
+    def close(self):
+        if self.fsync_policy != "never":
+            self.sync()
+        self._segment_file.close()
+        self._index_file.close()
+        for fd in self._read_fds.values():
+            os.close(fd)
+        self._read_fds = {}
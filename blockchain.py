@@ -1,38 +1,156 @@
+import sys
 import time
-import json
 import hashlib
+import struct
+import threading
 import uuid
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives.asymmetric.utils import \
     decode_dss_signature, encode_dss_signature
+from codec import encode_transaction, encode_block, decode_block
+from merkle import MerkleTree, merkle_root
+from difficulty import DifficultyAdjuster, bits_to_target, hash_meets_target
+from validation import validate_chain_parallel
+from state import AccountState, StateError
+from address_index import AddressHistory
+from undo import BlockUndo, UndoLog, ReorgError, UNDO_DEPTH
+from mempool import Mempool, MempoolError, RecentTransactions, RECENT_BLOCKS
+from keys import public_key_bytes, address_of, load_public_key
+
+# Binary block header layout (big-endian):
+#   version (4) | previous hash (32) | Merkle root (32) | timestamp (8, double)
+#   | difficulty target in compact "bits" form (4) | nonce (8)
+# Everything before the nonce is the fixed "prefix" that mining hashes once.
+BLOCK_VERSION = 1
+HEADER_PREFIX = struct.Struct(">I32s32sdI")
+NONCE = struct.Struct(">Q")
+HEADER_SIZE = HEADER_PREFIX.size + NONCE.size
+MAX_NONCE = 2 ** 64
+# Largest block, in bytes of its canonical encoding (codec.py)
+MAX_BLOCK_SIZE = 1024 * 1024
+
+# Fields of a sealed block that may still change: BFT votes are attached
+# after the proposal is sealed (they are outside the header), plus the
+# block's own caches
+SEALED_WRITABLE = frozenset(('signatures', '_merkle_tree', '_header', '_digest', '_computed_root', '_size'))
+
+
+class SealedBlockError(AttributeError):
+    """Raised when a sealed block is modified."""
+
+
+def pack_signature(r, s) -> bytes:
+    """An ECDSA (r, s) pair as 64 bytes."""
+    return r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+
+
+def unpack_signature(signature: bytes):
+    """The (r, s) pair of a 64-byte signature."""
+    return int.from_bytes(signature[:32], 'big'), int.from_bytes(signature[32:], 'big')
+
 
 class Transaction:
     """
     A simple transaction object storing the sender, recipient, amount,
     and a digital signature.
+
+    `nonce` numbers a sender's transactions 0, 1, 2, ...: a block must take
+    each sender's transactions in nonce order without gaps, and a nonce
+    can only be used once, so a signed transaction can't be replayed or
+    reordered. Rewards (sender NETWORK) keep nonce 0.
+
+    `public_key` is the sender's public key as a compressed point (see
+    keys.py), set when the transaction is signed; the sender must be the
+    address derived from it.
+
+    A chain holds millions of these, so they use __slots__, intern the
+    address strings (the same few addresses recur across transactions) and
+    keep the signature as 64 raw bytes. to_dict builds the JSON form for
+    the API.
+
+    The id is computed once, on first use of `txid`, and kept as the raw
+    32-byte digest (hex only at the API boundary); don't change a
+    transaction's fields after that (signing resets it).
     """
-    def __init__(self, sender, recipient, amount, signature=None):
-        self.sender = sender
-        self.recipient = recipient
+    __slots__ = ('sender', 'recipient', 'amount', 'signature', 'tx_type', 'fee', 'nonce', 'public_key',
+                 '_txid')
+
+    def __init__(self, sender, recipient, amount, signature=None, tx_type=None, fee=0, nonce=0,
+                 public_key=None):
+        self.sender = sys.intern(sender)
+        self.recipient = sys.intern(recipient)
         self.amount = amount
-        self.signature = signature  # (r, s) in simplified form, or None initially
+        self.signature = signature  # 64 bytes (r then s), or None initially
+        self.tx_type = tx_type  # e.g. "pos_reward"; None for ordinary transfers
+        # Paid by the sender on top of the amount to whoever collects the
+        # block's reward; a higher fee gets the transaction mined sooner
+        self.fee = fee
+        self.nonce = nonce
+        self.public_key = public_key  # compressed point, or None
+        self._txid = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a transaction from its to_dict form."""
+        signature = data.get('signature')
+        return cls(
+            sender=data['sender'],
+            recipient=data['recipient'],
+            amount=data['amount'],
+            signature=pack_signature(*signature) if signature is not None else None,
+            tx_type=data.get('type'),
+            fee=data.get('fee', 0),
+            nonce=data.get('nonce', 0),
+            public_key=bytes.fromhex(data['public_key']) if data.get('public_key') is not None else None
+        )
 
     def to_dict(self):
-        return {
+        data = {
             'sender': self.sender,
             'recipient': self.recipient,
             'amount': self.amount,
-            'signature': self.signature
+            'signature': list(unpack_signature(self.signature)) if self.signature is not None else None
         }
+        if self.tx_type is not None:
+            data['type'] = self.tx_type
+        if self.fee:
+            data['fee'] = self.fee
+        if self.nonce:
+            data['nonce'] = self.nonce
+        if self.public_key is not None:
+            data['public_key'] = self.public_key.hex()
+        return data
+
+    def to_bytes(self):
+        """Canonical binary encoding (see codec.py)."""
+        return encode_transaction(self)
+
+    @property
+    def txid(self) -> bytes:
+        if self._txid is None:
+            self._txid = self.compute_txid()
+        return self._txid
+
+    def compute_txid(self) -> bytes:
+        """The id, computed afresh (and not cached, to spare memory on scans)."""
+        return hashlib.sha256(encode_transaction(self)).digest()
+
+    def signed_data(self) -> bytes:
+        """
+        What the signature covers: the transaction's canonical encoding
+        without the signature, so every field is signed (see codec.py).
+        """
+        return encode_transaction(self, unsigned=True)
 
     def sign_transaction(self, private_key):
         """
-        Sign the transaction using ECDSA. The transaction's stringified version
-        is signed to produce a signature (r, s) tuple.
+        Sign the transaction using ECDSA. The matching public key is
+        attached, then the transaction's signed_data is signed to produce a
+        signature (r, s), stored as 64 bytes.
         """
-        tx_data = f"{self.sender}{self.recipient}{self.amount}"
-        tx_data_bytes = tx_data.encode('utf-8')
+        self.public_key = public_key_bytes(private_key.public_key())
+        tx_data_bytes = self.signed_data()
 
         signature = private_key.sign(
             tx_data_bytes,
@@ -40,20 +158,28 @@ class Transaction:
         )
 
         (r, s) = decode_dss_signature(signature)
-        self.signature = (r, s)
+        self.signature = pack_signature(r, s)
+        self._txid = None
 
-    def is_valid(self, public_key):
+    def is_valid(self, public_key=None):
         """
-        Check if the signature is valid given the provided public key.
+        Check if the signature is valid given the provided public key, or
+        else the transaction's own, which must belong to the sender.
         """
         if not self.signature:
             return False
+        if public_key is None:
+            if self.public_key is None or address_of(self.public_key) != self.sender:
+                return False
+            try:
+                public_key = load_public_key(self.public_key)
+            except ValueError:
+                return False
 
-        (r, s) = self.signature
+        (r, s) = unpack_signature(self.signature)
         signature_asn1 = encode_dss_signature(r, s)
 
-        tx_data = f"{self.sender}{self.recipient}{self.amount}"
-        tx_data_bytes = tx_data.encode('utf-8')
+        tx_data_bytes = self.signed_data()
 
         try:
             public_key.verify(signature_asn1, tx_data_bytes, ec.ECDSA(hashes.SHA256()))
@@ -73,116 +199,664 @@ class Block:
     - hash (once calculated)
     - signatures (for BFT, if used)
     - consensus_method (e.g., 'pow', 'bft')
+    - merkle_root (commits to the transactions)
+    - bits (PoW difficulty target in compact form, 0 for other blocks)
+    - version (header format version)
+
+    The block hash is the SHA-256 of a fixed-size binary header, so its cost
+    does not depend on the number of transactions. The header commits to
+    the transactions through the Merkle root. BFT signatures and the
+    consensus label are metadata outside the header, so a proposal keeps
+    its hash once votes are attached.
+
+    previous_hash, merkle_root and hash are raw 32-byte strings; to_dict
+    renders them as hex.
+
+    A block is sealed once it is complete (see seal): from then on it can't
+    be changed, so its header, hash, recomputed Merkle root and encoded size
+    are computed once and cached, and validating it again costs next to
+    nothing.
     """
-    def __init__(self, index, transactions, timestamp, previous_hash, nonce=0, signatures=None, consensus_method=None):
+    __slots__ = ('index', 'transactions', 'timestamp', 'previous_hash', 'nonce', 'signatures',
+                 'consensus_method', 'merkle_root', 'bits', 'version', 'hash', '_merkle_tree',
+                 '_sealed', '_header', '_digest', '_computed_root', '_size')
+
+    def __init__(self, index, transactions, timestamp, previous_hash, nonce=0, signatures=None,
+                 consensus_method=None, merkle_root=None, bits=0, version=BLOCK_VERSION):
+        object.__setattr__(self, '_sealed', False)
         self.index = index
-        self.transactions = transactions  # list of transaction dicts
+        self.transactions = transactions  # list of Transaction
         self.timestamp = timestamp
         self.previous_hash = previous_hash
         self.nonce = nonce
         self.signatures = signatures if signatures else []  # BFT: list of validator sigs
         self.consensus_method = consensus_method # Added: 'pow' or 'bft'
+        self.merkle_root = merkle_root  # computed from transactions when None
+        self.bits = bits
+        self.version = version
         self.hash = None
+        self._merkle_tree = None  # built by merkle_tree() for inclusion proofs
+        # Caches, only used once the block is sealed
+        self._header = None
+        self._digest = None
+        self._computed_root = None
+        self._size = None
+
+    def __setattr__(self, name, value):
+        if self._sealed:
+            if name not in SEALED_WRITABLE:
+                raise SealedBlockError(f"Block {self.index} is sealed; can't set '{name}'")
+            if name == 'signatures':
+                value = tuple(value)
+                object.__setattr__(self, '_size', None)
+        object.__setattr__(self, name, value)
+
+    @property
+    def sealed(self):
+        return self._sealed
+
+    def seal(self):
+        """
+        Freeze the block. Fills in the Merkle root and hash if they are
+        missing and turns the transactions and signatures into tuples;
+        after this only the BFT signatures can be replaced. Returns the
+        block.
+        """
+        if self._sealed:
+            return self
+        if self.merkle_root is None:
+            self.merkle_root = self.compute_merkle_root()
+        if self.hash is None:
+            self.hash = self.compute_hash()
+        self.transactions = tuple(self.transactions)
+        self.signatures = tuple(self.signatures)
+        object.__setattr__(self, '_sealed', True)
+        return self
+
+    def compute_merkle_root(self):
+        """
+        Compute the Merkle root of the block's transactions (once, for a
+        sealed block).
+        """
+        if not self._sealed:
+            return merkle_root(self.transactions)
+        if self._computed_root is None:
+            self._computed_root = merkle_root(self.transactions)
+        return self._computed_root
+
+    def merkle_tree(self):
+        """
+        The block's Merkle tree, built on first use. Only blocks that
+        inclusion proofs are asked for keep a tree; it holds every level,
+        which would double the memory of a chain if kept for all blocks.
+        """
+        if self._merkle_tree is None:
+            self._merkle_tree = MerkleTree.from_transactions(self.transactions)
+        return self._merkle_tree
+
+    def inclusion_proof(self, tx_index):
+        """
+        Proof that the transaction at `tx_index` is committed to by this
+        block's Merkle root (see merkle.verify_transaction).
+        """
+        return self.merkle_tree().proof(tx_index)
+
+    def header_prefix(self):
+        """
+        The binary header without the trailing nonce.
+        """
+        if self.merkle_root is None:
+            self.merkle_root = self.compute_merkle_root()
+        return HEADER_PREFIX.pack(
+            self.version,
+            self.previous_hash,
+            self.merkle_root,
+            self.timestamp,
+            self.bits
+        )
+
+    @property
+    def target(self):
+        """
+        The numeric PoW target encoded by `bits`.
+        """
+        return bits_to_target(self.bits)
+
+    def header(self):
+        """
+        The full binary block header.
+        """
+        if not self._sealed:
+            return self.header_prefix() + NONCE.pack(self.nonce)
+        if self._header is None:
+            self._header = self.header_prefix() + NONCE.pack(self.nonce)
+        return self._header
 
     def compute_hash(self):
         """
-        Compute the SHA-256 hash of the block's contents (excluding 'hash').
+        Compute the SHA-256 hash of the block header (once, for a sealed
+        block).
         """
-        block_string = json.dumps({
-            'index': self.index,
-            'transactions': [tx for tx in self.transactions],
-            'timestamp': self.timestamp,
-            'previous_hash': self.previous_hash,
-            'nonce': self.nonce,
-            'signatures': self.signatures,
-            'consensus_method': self.consensus_method # Added
-        }, sort_keys=True)
-        return hashlib.sha256(block_string.encode()).hexdigest()
+        if not self._sealed:
+            return hashlib.sha256(self.header()).digest()
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.header()).digest()
+        return self._digest
+
+    def size(self):
+        """
+        Size of the block's binary encoding in bytes.
+        """
+        if not self._sealed:
+            return len(self.to_bytes())
+        if self._size is None:
+            self._size = len(self.to_bytes())
+        return self._size
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuild a block from the output of to_dict (e.g. when loading it
+        from disk or receiving it from a peer).
+        """
+        block = cls(
+            index=data['index'],
+            transactions=[Transaction.from_dict(tx) for tx in data['transactions']],
+            timestamp=data['timestamp'],
+            previous_hash=bytes.fromhex(data['previous_hash']),
+            nonce=data['nonce'],
+            signatures=data['signatures'],
+            consensus_method=data['consensus_method'],
+            merkle_root=bytes.fromhex(data['merkle_root']),
+            bits=data['bits'],
+            version=data['version']
+        )
+        block.hash = bytes.fromhex(data['hash']) if data['hash'] is not None else None
+        return block.seal() if block.hash is not None else block
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Decode a block from the output of to_bytes. `data` may be a
+        memoryview; it is read in place.
+        """
+        return decode_block(data)
+
+    def to_bytes(self):
+        """
+        Canonical binary encoding of the block and its transactions, used
+        for storage and for sending blocks to peers (see codec.py).
+        """
+        return encode_block(self)
 
     def to_dict(self):
+        if self.merkle_root is None:
+            self.merkle_root = self.compute_merkle_root()
         return {
             'index': self.index,
-            'transactions': self.transactions,
+            'transactions': [tx.to_dict() for tx in self.transactions],
             'timestamp': self.timestamp,
-            'previous_hash': self.previous_hash,
+            'previous_hash': self.previous_hash.hex(),
             'nonce': self.nonce,
             'signatures': self.signatures,
             'consensus_method': self.consensus_method, # Added
-            'hash': self.hash
+            'merkle_root': self.merkle_root.hex(),
+            'bits': self.bits,
+            'version': self.version,
+            'hash': self.hash.hex() if self.hash is not None else None
         }
 
 
 class Blockchain:
-    def __init__(self):
+    """
+    The chain of blocks and the pool of pending transactions.
+
+    With a BlockStore, every accepted block is also appended to disk, and a
+    new Blockchain picks up the stored chain instead of starting over from
+    a fresh genesis block. With a ChainIndex, blocks and transactions can be
+    looked up by hash, id and address without scanning the chain.
+    """
+    def __init__(self, store=None, index=None, undo_depth=UNDO_DEPTH, mempool=None,
+                 recent_blocks=RECENT_BLOCKS, verifier=None):
+        self.store = store
+        self.index = index
+        # A SignatureVerifier for the transfers in new blocks; None skips
+        # signature checks
+        self.verifier = verifier
         self.chain = []
-        self.current_transactions = []
-        self.create_genesis_block()
+        # Balance of every address, kept up to date as blocks are added
+        self.state = AccountState()
+        # Where each address appears on the chain, for paging its history
+        self.history = AddressHistory()
+        # What the newest blocks changed, so they can be disconnected again
+        self.undo_log = UndoLog(undo_depth)
+        # Pending transactions, best fee rate first
+        self.mempool = mempool if mempool is not None else Mempool()
+        # Ids of recently mined transactions, to turn away replays
+        self.recent = RecentTransactions(recent_blocks)
+        # Guards the chain and the transaction pool against concurrent
+        # updates (e.g. a background mining job and the HTTP handlers)
+        self.lock = threading.RLock()
+        # Bumped whenever the pending transactions or the tip change, so a
+        # miner can tell that its block template has gone stale
+        self.version = 0
+        # Decides the target of the next PoW block from recent block times
+        self.difficulty = DifficultyAdjuster()
+        # Every block up to this height has been validated; the checkpoint
+        # only holds while the block there still has validated_hash
+        self.validated_height = 0
+        self.validated_hash = None
+        if store is not None and len(store) > 0:
+            self.load_from_store()
+        else:
+            self.create_genesis_block()
+        if index is not None:
+            self.sync_index()
+        # Genesis is trusted by definition
+        self.validated_hash = self.chain[0].hash
+
+    def load_from_store(self):
+        """
+        Load the stored chain. Blocks were validated when they were first
+        added, so they are only replayed into the difficulty adjuster, the
+        account state and the address history, one at a time as they
+        stream off disk.
+        """
+        for block in self.store.iter_blocks():
+            try:
+                changes = self.state.block_changes(block)
+            except StateError as e:
+                # Written before balances or nonces were enforced: keep the
+                # block and its effect on the state, as the chain did at the
+                # time
+                print(f"[Warning] {e}")
+                changes = self.state.block_changes(block, check=False)
+            self._connect_block(block, changes)
+
+    def sync_index(self):
+        """
+        Bring the index in line with the chain: drop blocks the chain no
+        longer has and index the ones it hasn't seen (e.g. when the index
+        is enabled on an existing chain). An index built for a different
+        chain is rebuilt from scratch.
+        """
+        with self.index.transaction():
+            self.index.remove_from(len(self.chain))
+            tip = self.index.tip_height()
+            if tip >= 0 and self.index.block_hash(tip) != self.chain[tip].hash.hex():
+                self.index.remove_from(0)
+            for block in self.chain[self.index.tip_height() + 1:]:
+                self.index.add_block(block, [tx.compute_txid() for tx in block.transactions])
 
     def create_genesis_block(self):
         genesis_block = Block(
             index=0,
             transactions=[],
             timestamp=time.time(),
-            previous_hash="0",
+            previous_hash=bytes(32),
             nonce=0,
             signatures=[],
             consensus_method="genesis" # Added
         )
-        genesis_block.hash = genesis_block.compute_hash()
-        self.chain.append(genesis_block)
+        genesis_block.seal()
+        self._persist_block(genesis_block)
+        self._connect_block(genesis_block, self.state.block_changes(genesis_block))
 
     def get_last_block(self):
         return self.chain[-1]
 
-    def add_transaction(self, transaction: Transaction):
+    def add_transaction(self, transaction: Transaction, added=None):
         """
-        Add a transaction to the list of current transactions.
-        (Here we assume transactions are validated externally.)
+        Add a transaction to the mempool, admitted at `added` (default now).
+        Raises MempoolError if its signature is invalid, it is already
+        pending, was mined in one of the recent blocks, reuses a nonce,
+        would overdraw its sender together with the sender's other pending
+        transactions, or the pool turns it away. A transaction with a bad
+        signature would otherwise sink every block built from the pool.
         """
-        self.current_transactions.append(transaction.to_dict())
+        # Outside the lock: it is the slow part. New transactions can't be
+        # in the signature cache, but a valid one goes in, so the block that
+        # takes it won't check it again
+        if self.verifier is not None and not self.verifier.verify(transaction, cached=False):
+            raise MempoolError("Invalid signature")
+        with self.lock:
+            if transaction.txid in self.recent:
+                raise MempoolError("Transaction is already on the chain")
+            # Make room from expired transactions before anything is evicted
+            if self.mempool.expire():
+                self.version += 1
+            sender = transaction.sender
+            self.mempool.add(transaction, added, self.state.nonce(sender), self.state.balance(sender))
+            self.version += 1
+
+    def next_nonce(self, sender):
+        """The nonce for the sender's next transaction, after its pending ones."""
+        with self.lock:
+            return self.mempool.next_nonce(sender, self.state.nonce(sender))
+
+    def expire_transactions(self):
+        """Drop pending transactions past their TTL. Returns how many."""
+        with self.lock:
+            expired = self.mempool.expire()
+            if expired:
+                self.version += 1
+            return expired
 
-    def add_block(self, block: Block):
+    @property
+    def current_transactions(self):
         """
-        Add a block to the chain after verification.
+        The pending transactions that could be mined, best fee rate first
+        (each sender's in nonce order).
         """
-        # 1. Check that previous_hash matches
-        last_block_hash = self.get_last_block().hash
-        if block.previous_hash != last_block_hash:
-            print("[Error] The block's previous_hash doesn't match the chain's last block.")
-            return False
+        with self.lock:
+            return self.mempool.transactions()
 
-        # 2. Recompute hash to ensure correctness
-        block.hash = block.compute_hash()
-        if not self.is_valid_block(block):
-            print("[Error] Block hash or structure is invalid.")
-            return False
+    def add_block(self, block: Block, check_signatures=True):
+        """
+        Add a block to the chain after verification. With
+        check_signatures=False, transaction signatures are trusted (for
+        blocks this chain already accepted once).
+        """
+        with self.lock:
+            # 1. The block must extend the tip: the next height, and
+            # previous_hash matching the last block. Everything derived
+            # from the chain (undo log, indexes, checkpoint) is keyed by
+            # block.index
+            if block.index != len(self.chain):
+                print(f"[Error] The block's index {block.index} doesn't follow the chain's "
+                      f"height {len(self.chain) - 1}.")
+                return False
+            last_block_hash = self.get_last_block().hash
+            if block.previous_hash != last_block_hash:
+                print("[Error] The block's previous_hash doesn't match the chain's last block.")
+                return False
 
+            # 2. PoW blocks must use the target the chain currently asks for
+            if block.consensus_method == "pow" and block.bits != self.difficulty.next_bits():
+                print("[Error] The block's difficulty target doesn't match the chain's.")
+                return False
+
+            # 3. Freeze the block, then check its hash and structure
+            block.seal()
+            if not self.is_valid_block(block):
+                print("[Error] Block hash or structure is invalid.")
+                return False
+            if block.size() > MAX_BLOCK_SIZE:
+                print(f"[Error] Block is {block.size()} bytes, more than the {MAX_BLOCK_SIZE} allowed.")
+                return False
+
+            # 4. Every transfer must be covered by its sender's balance
+            try:
+                changes = self.state.block_changes(block)
+            except StateError as e:
+                print(f"[Error] {e}")
+                return False
+
+            # 5. Every transfer must be signed by its sender; checked last,
+            # as it is by far the most expensive step
+            if check_signatures and self.verifier is not None:
+                position = self.verifier.first_invalid(block.transactions)
+                if position is not None:
+                    print(f"[Error] Transaction {position} of block {block.index} has an invalid signature.")
+                    return False
+
+            self._persist_block(block)
+            self._connect_block(block, changes)
+            # Only what the block took leaves the pool; anything that
+            # arrived while it was being built stays for the next one
+            self.mempool.remove_included(block.transactions)
+            self.version += 1
+            # The block was just validated; if everything before it was
+            # too, the checkpoint moves forward with the tip
+            if self.validated_height == block.index - 1:
+                self._advance_checkpoint(block)
+            return True
+
+    def _connect_block(self, block: Block, changes):
+        """
+        Append a block and move the state derived from the chain forward,
+        recording what it overwrote in the undo log.
+        """
+        snapshot = self.difficulty.snapshot() if block.consensus_method == "pow" else None
         self.chain.append(block)
-        return True
+        balances, nonces = self.state.commit(block, changes)
+        self.history.add_block(block)
+        self.recent.add_block(block)
+        self.difficulty.observe(block)
+        if block.index > 0:
+            self.undo_log.push(BlockUndo(block.index, balances, nonces, snapshot))
+
+    def disconnect_to(self, height):
+        """
+        Roll the chain back so the block at `height` is the tip, undoing
+        each later block's changes to the balances, nonces, address history and
+        difficulty from its undo record, newest first, and dropping the
+        blocks from the store and the index. Returns the disconnected
+        blocks, newest first. Raises ReorgError if `height` is below genesis
+        or deeper than the undo log reaches.
+        """
+        with self.lock:
+            tip = len(self.chain) - 1
+            if not 0 <= height <= tip:
+                raise ReorgError(f"No block at height {height}")
+            if not self.undo_log.can_undo_to(height, tip):
+                raise ReorgError(f"Can't roll back to height {height}: only the last "
+                                 f"{len(self.undo_log)} blocks can be undone")
+            if height == tip:
+                return []
+
+            if self.index is not None:
+                with self.index.transaction():
+                    self.index.remove_from(height + 1)
+                    if self.store is not None:
+                        self.store.truncate(height + 1)
+            elif self.store is not None:
+                self.store.truncate(height + 1)
 
-    def is_valid_block(self, block: Block):
+            disconnected = []
+            while len(self.chain) - 1 > height:
+                block = self.chain.pop()
+                record = self.undo_log.pop(block.index)
+                self.state.revert((record.balances, record.nonces), block.index - 1)
+                self.history.remove_block(block)
+                self.recent.remove_block(block)
+                if record.difficulty is not None:
+                    self.difficulty.unobserve(block, record.difficulty)
+                disconnected.append(block)
+
+            if self.validated_height > height:
+                self.validated_height = height
+                self.validated_hash = self.chain[height].hash
+            self.version += 1
+            return disconnected
+
+    def reorganize(self, blocks):
+        """
+        Switch to a competing branch: `blocks` are its blocks in order, the
+        first one building on a block of this chain. The branch must end up
+        longer than the current chain. Blocks after the fork point are
+        disconnected and the branch's blocks added in their place; if any of
+        them is rejected, the original blocks are restored. Transfers from
+        the disconnected blocks that the branch doesn't include go back to
+        the mempool (the branch's own transactions leave it as its blocks
+        are added). Returns whether the switch happened.
+        """
+        with self.lock:
+            if not blocks:
+                return False
+            fork = self.find_block_by_hash(blocks[0].previous_hash)
+            if fork is None:
+                print("[Error] The branch doesn't connect to this chain.")
+                return False
+            if fork.index + len(blocks) <= len(self.chain) - 1:
+                print("[Error] The branch isn't longer than the current chain.")
+                return False
+
+            try:
+                disconnected = self.disconnect_to(fork.index)
+            except ReorgError as e:
+                print(f"[Error] {e}")
+                return False
+            for block in blocks:
+                if not self.add_block(block):
+                    self.disconnect_to(fork.index)
+                    for original in reversed(disconnected):
+                        self.add_block(original, check_signatures=False)
+                    return False
+
+            for block in reversed(disconnected):
+                for tx in block.transactions:
+                    if tx.sender == "NETWORK":
+                        continue
+                    try:
+                        # Turned away if the new branch has it too
+                        self.add_transaction(tx)
+                    except MempoolError:
+                        pass
+            self.version += 1
+            return True
+
+    def _persist_block(self, block: Block):
         """
-        Very simplified check for block validity. 
+        Write a block to the store and the index as one logical commit:
+        if either fails, the index rows are rolled back and the block is
+        not added.
         """
-        # Recalculate hash
-        recomputed_hash = block.compute_hash()
-        return recomputed_hash == block.hash
+        if self.index is None:
+            if self.store is not None:
+                self.store.append(block)
+            return
+        # Genesis is indexed by sync_index once the index is attached
+        with self.index.transaction():
+            if block.index > 0:
+                self.index.add_block(block, [tx.txid for tx in block.transactions])
+            if self.store is not None:
+                self.store.append(block)
+
+    def find_block_by_hash(self, block_hash: bytes):
+        """The block with this hash, or None."""
+        if self.index is not None:
+            height = self.index.block_height(block_hash.hex())
+            return self.chain[height] if height is not None else None
+        return next((block for block in self.chain if block.hash == block_hash), None)
+
+    def find_transaction(self, txid: bytes):
+        """Every (block, position) at which a transaction with this id appears."""
+        if self.index is not None:
+            return [(self.chain[height], position)
+                    for height, position in self.index.transaction_locations(txid)]
+        return [(block, position) for block in self.chain
+                for position, tx in enumerate(block.transactions) if tx.compute_txid() == txid]
 
-    def is_valid_chain(self):
+    def address_transactions(self, address, role, limit=100):
         """
-        Check the entire chain's validity by verifying hashes and links.
+        (block, position) of the newest `limit` transactions where `address`
+        is the sender or recipient (`role`), newest first.
         """
-        for i in range(1, len(self.chain)):
-            curr_block = self.chain[i]
-            prev_block = self.chain[i - 1]
+        if role not in ("sender", "recipient"):
+            raise ValueError("role must be 'sender' or 'recipient'")
+        if self.index is not None:
+            return [(self.chain[height], position)
+                    for height, position in self.index.address_locations(address, role, limit)]
+        found = []
+        for block in reversed(self.chain):
+            for position in range(len(block.transactions) - 1, -1, -1):
+                if getattr(block.transactions[position], role) == address:
+                    found.append((block, position))
+                    if len(found) == limit:
+                        return found
+        return found
+
+    def address_history(self, address, cursor=None, limit=100):
+        """
+        One page of the transactions `address` sent or received, newest
+        first: ([(block, position)], cursor of the next page or None).
+        """
+        with self.lock:
+            locations, next_cursor = self.history.page(address, cursor, limit)
+            return [(self.chain[height], position) for height, position in locations], next_cursor
+
+    def is_valid_block(self, block: Block, recompute=False):
+        """
+        Very simplified check for block validity: the Merkle root must match
+        the transactions, the header must hash to block.hash, and a PoW
+        block's hash must be at most its target. With recompute=True the
+        root and hash are computed afresh rather than read from a sealed
+        block's caches, which don't see changes to its transactions.
+        """
+        if recompute:
+            computed_root = merkle_root(block.transactions)
+            recomputed_hash = hashlib.sha256(block.header_prefix() + NONCE.pack(block.nonce)).digest()
+        else:
+            computed_root = block.compute_merkle_root()
+            recomputed_hash = block.compute_hash()
+
+        if block.merkle_root != computed_root or recomputed_hash != block.hash:
+            return False
+
+        if block.consensus_method == "pow":
+            return block.bits != 0 and hash_meets_target(block.hash, block.target)
+        return True
+
+    def is_valid_chain(self, deep=False, workers=None):
+        """
+        Check the chain's validity by verifying hashes and links.
+
+        Blocks up to the validated checkpoint (validated_height, whose hash
+        must still be validated_hash) are trusted, so only the blocks added
+        since the last check are verified. With deep=True, or if the
+        checkpoint no longer matches the chain, every block from height 1
+        is re-verified; a deep check recomputes each Merkle root and hash
+        instead of trusting the values sealed blocks cache. A deep check
+        with `workers` > 1 is spread over that many processes (see
+        audit_chain).
+        """
+        if deep and workers and workers > 1:
+            return self.audit_chain(workers)['valid']
+
+        with self.lock:
+            checkpoint_ok = self.validated_height < len(self.chain) and \
+                self.chain[self.validated_height].hash == self.validated_hash
+            start = 1 if deep or not checkpoint_ok else self.validated_height + 1
+            # Only the unvalidated suffix (plus the block it links to)
+            blocks = self.chain[start - 1:]
+
+        for i in range(1, len(blocks)):
+            curr_block = blocks[i]
+            prev_block = blocks[i - 1]
 
             if curr_block.previous_hash != prev_block.hash:
                 return False
 
-            if curr_block.compute_hash() != curr_block.hash:
+            if not self.is_valid_block(curr_block, recompute=deep):
                 return False
 
+        with self.lock:
+            self._advance_checkpoint(blocks[-1])
         return True
 
-    def clear_transactions(self):
-        self.current_transactions = []
+    def audit_chain(self, workers=None):
+        """
+        Re-verify every block in parallel across `workers` processes (default:
+        one per CPU), recomputing hashes and Merkle roots from scratch rather
+        than trusting the values sealed blocks cache. Returns the report from
+        validate_chain_parallel, which includes the first invalid height and
+        the throughput in blocks/sec.
+        """
+        with self.lock:
+            blocks = list(self.chain)
+        report = validate_chain_parallel(blocks, workers)
+        if report['valid']:
+            with self.lock:
+                self._advance_checkpoint(blocks[-1])
+        return report
+
+    def _advance_checkpoint(self, block: Block):
+        """
+        Mark everything up to `block` as validated, if the chain still ends
+        in that block's branch.
+        """
+        if block.index < len(self.chain) and self.chain[block.index] is block \
+                and block.index >= self.validated_height:
+            self.validated_height = block.index
+            self.validated_hash = block.hash
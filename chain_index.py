@@ -0,0 +1,119 @@
+"""
+Optional SQLite secondary indexes over the chain.
+
+Maps block hashes to heights, and transaction ids and addresses to the
+(height, position) of the transactions they appear in, so lookups don't
+have to scan Blockchain.chain. The blocks themselves stay in the chain and
+block store; the index only says where to look.
+
+Blockchain.add_block writes a block's rows inside a `transaction()` that
+also covers appending the block to the store, so the index and the stored
+chain move forward together.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    height INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    height INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    txid TEXT NOT NULL,
+    sender TEXT,
+    recipient TEXT,
+    PRIMARY KEY (height, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS transactions_txid ON transactions (txid);
+CREATE INDEX IF NOT EXISTS transactions_sender ON transactions (sender, height, position);
+CREATE INDEX IF NOT EXISTS transactions_recipient ON transactions (recipient, height, position);
+"""
+
+
+class ChainIndex:
+    """
+    SQLite-backed lookup tables for blocks and transactions.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level="DEFERRED")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group index updates (and whatever else the caller does inside the
+        block) into one commit; everything is rolled back on an exception.
+        """
+        with self._lock:
+            try:
+                yield
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def tip_height(self):
+        """Height of the highest indexed block, or -1 if empty."""
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(height) FROM blocks").fetchone()
+        return -1 if row[0] is None else row[0]
+
+    def add_block(self, block, txids):
+        """
+        Index a block. `txids` are the ids of block.transactions, in order.
+        Call inside transaction().
+        """
+        self._conn.execute("INSERT INTO blocks (height, hash) VALUES (?, ?)", (block.index, block.hash.hex()))
+        self._conn.executemany(
+            "INSERT INTO transactions (height, position, txid, sender, recipient) VALUES (?, ?, ?, ?, ?)",
+            [(block.index, position, txid.hex(), tx.sender, tx.recipient)
+             for position, (tx, txid) in enumerate(zip(block.transactions, txids))]
+        )
+
+    def remove_from(self, height):
+        """Drop every block at `height` and above. Call inside transaction()."""
+        self._conn.execute("DELETE FROM blocks WHERE height >= ?", (height,))
+        self._conn.execute("DELETE FROM transactions WHERE height >= ?", (height,))
+
+    def block_hash(self, height):
+        with self._lock:
+            row = self._conn.execute("SELECT hash FROM blocks WHERE height = ?", (height,)).fetchone()
+        return row[0] if row else None
+
+    def block_height(self, block_hash):
+        with self._lock:
+            row = self._conn.execute("SELECT height FROM blocks WHERE hash = ?", (block_hash,)).fetchone()
+        return row[0] if row else None
+
+    def transaction_locations(self, txid):
+        """Every (height, position) a transaction id appears at."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT height, position FROM transactions WHERE txid = ? ORDER BY height, position",
+                (txid.hex(),)).fetchall()
+
+    def address_locations(self, address, role, limit):
+        """
+        (height, position) of the newest `limit` transactions where
+        `address` is the sender or recipient (`role`).
+        """
+        if role not in ("sender", "recipient"):
+            raise ValueError("role must be 'sender' or 'recipient'")
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT height, position FROM transactions WHERE {role} = ? "
+                f"ORDER BY height DESC, position DESC LIMIT ?",
+                (address, limit)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
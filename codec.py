@@ -0,0 +1,315 @@
+"""
+Canonical binary encoding of transactions and blocks.
+
+The same bytes are used to hash transactions (txids and Merkle leaves), to
+store blocks on disk and to send them to peers, so a block has exactly one
+encoding. All integers are big-endian and fixed-width, hashes are raw 32-byte
+strings, strings are UTF-8 with a length prefix, and ECDSA signatures are
+packed as 64 bytes (r and s, 32 bytes each).
+
+Transaction:
+    flags        u8    TX_SIGNED | TX_FLOAT_AMOUNT | TX_TYPED | TX_FEE | TX_FLOAT_FEE
+                       | TX_NONCE | TX_KEYED
+    sender       u16 length + UTF-8
+    recipient    u16 length + UTF-8
+    amount       i64, or f64 with TX_FLOAT_AMOUNT
+    fee          i64 with TX_FEE, f64 with TX_FLOAT_FEE (absent when 0)
+    nonce        u64, with TX_NONCE (absent when 0)
+    public key   u8 length + compressed point, with TX_KEYED
+    type         u8 length + UTF-8, with TX_TYPED
+    signature    r (32 bytes) + s (32 bytes), with TX_SIGNED
+
+A signature covers the transaction's encoding without it (no TX_SIGNED
+flag, no signature bytes), so every other field is signed, each with its
+length prefix or fixed width: no two transactions sign the same bytes.
+
+Block:
+    codec version u8, block version u32, index u64, previous hash 32s,
+    Merkle root 32s, timestamp f64, bits u32, nonce u64, flags u8
+    hash          32s, with BLOCK_HASHED
+    consensus     u8 length + UTF-8, with BLOCK_CONSENSUS
+    signatures    u16 count, each u16 length + UTF-8
+    transactions  u32 count, each encoded as above
+
+Decoding reads straight out of a bytes object or memoryview with
+struct.unpack_from, without copying the buffer.
+"""
+import codecs
+import struct
+
+CODEC_VERSION = 1
+
+TX_SIGNED = 0x01
+TX_FLOAT_AMOUNT = 0x02
+TX_TYPED = 0x04
+TX_FEE = 0x08
+TX_FLOAT_FEE = 0x10
+TX_NONCE = 0x20
+TX_KEYED = 0x40
+
+BLOCK_HASHED = 0x01
+BLOCK_CONSENSUS = 0x02
+
+U8 = struct.Struct(">B")
+U16 = struct.Struct(">H")
+U32 = struct.Struct(">I")
+TX_HEAD = struct.Struct(">BH")  # flags, sender length
+INT_AMOUNT = struct.Struct(">q")
+FLOAT_AMOUNT = struct.Struct(">d")
+NONCE = struct.Struct(">Q")
+SIGNATURE_SIZE = 64
+BLOCK_HEAD = struct.Struct(">BIQ32s32sdIQB")
+HASH_SIZE = 32
+MAX_STR16 = 0xFFFF
+MAX_STR8 = 0xFF
+
+_utf8_decode = codecs.utf_8_decode
+
+
+class CodecError(ValueError):
+    """Raised for values that cannot be encoded and for malformed input."""
+
+
+# --- encoding ---
+
+def _str8(value) -> bytes:
+    data = value.encode("utf-8")
+    if len(data) > MAX_STR8:
+        raise CodecError(f"String too long to encode: {len(data)} bytes")
+    return U8.pack(len(data)) + data
+
+
+def _transaction_parts(tx, parts, unsigned=False):
+    """
+    Append the encoded pieces of a Transaction to `parts`, leaving out its
+    signature if `unsigned`.
+    """
+    sender = tx.sender.encode("utf-8")
+    recipient = tx.recipient.encode("utf-8")
+    if len(sender) > MAX_STR16 or len(recipient) > MAX_STR16:
+        raise CodecError("Address too long to encode")
+
+    amount = tx.amount
+    amount_type = type(amount)
+    fee = tx.fee
+    fee_type = type(fee)
+    try:
+        if amount_type is int:
+            flags = 0
+            amount = INT_AMOUNT.pack(amount)
+        elif amount_type is float:
+            flags = TX_FLOAT_AMOUNT
+            amount = FLOAT_AMOUNT.pack(amount)
+        else:
+            raise CodecError(f"Amount must be a number, got {amount!r}")
+        if not fee:
+            if fee_type is not int and fee_type is not float:
+                raise CodecError(f"Fee must be a number, got {fee!r}")
+            fee = None
+        elif fee_type is int:
+            flags |= TX_FEE
+            fee = INT_AMOUNT.pack(fee)
+        elif fee_type is float:
+            flags |= TX_FLOAT_FEE
+            fee = FLOAT_AMOUNT.pack(fee)
+        else:
+            raise CodecError(f"Fee must be a number, got {fee!r}")
+        nonce = tx.nonce
+        if nonce:
+            flags |= TX_NONCE
+            nonce = NONCE.pack(nonce)
+        else:
+            nonce = None
+    except struct.error:
+        raise CodecError(f"Amount, fee or nonce out of range: {tx.amount!r}, {tx.fee!r}, {tx.nonce!r}")
+
+    signature = None if unsigned else tx.signature
+    tx_type = tx.tx_type
+    public_key = tx.public_key
+    if signature is not None:
+        flags |= TX_SIGNED
+    if tx_type is not None:
+        flags |= TX_TYPED
+    if public_key is not None:
+        flags |= TX_KEYED
+        if len(public_key) > MAX_STR8:
+            raise CodecError(f"Public key too long to encode: {len(public_key)} bytes")
+
+    parts += (TX_HEAD.pack(flags, len(sender)), sender, U16.pack(len(recipient)), recipient, amount)
+    if fee is not None:
+        parts.append(fee)
+    if nonce is not None:
+        parts.append(nonce)
+    if public_key is not None:
+        parts += (U8.pack(len(public_key)), public_key)
+    if tx_type is not None:
+        parts.append(_str8(tx_type))
+    if signature is not None:
+        if len(signature) != SIGNATURE_SIZE:
+            raise CodecError(f"Signature must be {SIGNATURE_SIZE} bytes")
+        parts.append(signature)
+
+
+def encode_transaction(tx, unsigned=False) -> bytes:
+    """
+    Canonical encoding of a Transaction; with unsigned=True, the bytes its
+    signature covers.
+    """
+    parts = []
+    _transaction_parts(tx, parts, unsigned)
+    return b"".join(parts)
+
+
+def block_overhead(consensus_method=None, signatures=()) -> int:
+    """
+    Encoded size of a hashed block with no transactions: a block's size is
+    this plus the encoded size of each of its transactions.
+    """
+    size = BLOCK_HEAD.size + HASH_SIZE + U16.size + U32.size
+    if consensus_method is not None:
+        size += 1 + len(consensus_method.encode("utf-8"))
+    return size + sum(U16.size + len(signer.encode("utf-8")) for signer in signatures)
+
+
+def encode_block(block) -> bytes:
+    """Canonical encoding of a Block, including its transactions."""
+    if block.merkle_root is None:
+        block.merkle_root = block.compute_merkle_root()
+    flags = (BLOCK_HASHED if block.hash is not None else 0) \
+        | (BLOCK_CONSENSUS if block.consensus_method is not None else 0)
+    parts = [BLOCK_HEAD.pack(
+        CODEC_VERSION, block.version, block.index, block.previous_hash,
+        block.merkle_root, block.timestamp, block.bits, block.nonce, flags)]
+    if block.hash is not None:
+        parts.append(block.hash)
+    if block.consensus_method is not None:
+        parts.append(_str8(block.consensus_method))
+
+    signatures = block.signatures or []
+    parts.append(U16.pack(len(signatures)))
+    for signer in signatures:
+        signer = signer.encode("utf-8")
+        if len(signer) > MAX_STR16:
+            raise CodecError("Signer name too long to encode")
+        parts += (U16.pack(len(signer)), signer)
+
+    parts.append(U32.pack(len(block.transactions)))
+    for tx in block.transactions:
+        _transaction_parts(tx, parts)
+    return b"".join(parts)
+
+
+# --- decoding ---
+#
+# Readers work on a memoryview and slice it rather than copying. They don't
+# bounds-check every field: struct raises on a read past the end, and
+# decode_* check that the final offset lands exactly on the end of the input.
+
+def read_transaction(view, offset=0):
+    """Decode the transaction at `offset`. Returns (Transaction, end offset)."""
+    from blockchain import Transaction
+    return _read_transaction(view, offset, Transaction)
+
+
+def _read_transaction(view, offset, Transaction):
+    flags, size = TX_HEAD.unpack_from(view, offset)
+    offset += TX_HEAD.size
+    end = offset + size
+    sender = _utf8_decode(view[offset:end])[0]
+    (size,) = U16.unpack_from(view, end)
+    offset = end + U16.size
+    end = offset + size
+    recipient = _utf8_decode(view[offset:end])[0]
+    (amount,) = (FLOAT_AMOUNT if flags & TX_FLOAT_AMOUNT else INT_AMOUNT).unpack_from(view, end)
+    offset = end + INT_AMOUNT.size
+    fee = 0
+    if flags & (TX_FEE | TX_FLOAT_FEE):
+        (fee,) = (FLOAT_AMOUNT if flags & TX_FLOAT_FEE else INT_AMOUNT).unpack_from(view, offset)
+        offset += INT_AMOUNT.size
+    nonce = 0
+    if flags & TX_NONCE:
+        (nonce,) = NONCE.unpack_from(view, offset)
+        offset += NONCE.size
+    public_key = None
+    if flags & TX_KEYED:
+        size = view[offset]
+        public_key = bytes(view[offset + 1:offset + 1 + size])
+        offset += 1 + size
+
+    tx_type = signature = None
+    if flags & TX_TYPED:
+        size = view[offset]
+        tx_type = _utf8_decode(view[offset + 1:offset + 1 + size])[0]
+        offset += 1 + size
+    if flags & TX_SIGNED:
+        signature = bytes(view[offset:offset + SIGNATURE_SIZE])
+        offset += SIGNATURE_SIZE
+    return Transaction(sender, recipient, amount, signature, tx_type, fee, nonce, public_key), offset
+
+
+def read_block(view, offset=0):
+    """Decode the block at `offset`. Returns (Block, end offset)."""
+    from blockchain import Block, Transaction
+
+    codec_version, version, index, previous_hash, merkle_root, timestamp, bits, nonce, flags = \
+        BLOCK_HEAD.unpack_from(view, offset)
+    if codec_version != CODEC_VERSION:
+        raise CodecError(f"Unsupported codec version {codec_version}")
+    offset += BLOCK_HEAD.size
+    block_hash = None
+    if flags & BLOCK_HASHED:
+        block_hash = bytes(view[offset:offset + HASH_SIZE])
+        offset += HASH_SIZE
+    consensus_method = None
+    if flags & BLOCK_CONSENSUS:
+        size = view[offset]
+        consensus_method = _utf8_decode(view[offset + 1:offset + 1 + size])[0]
+        offset += 1 + size
+
+    (count,) = U16.unpack_from(view, offset)
+    offset += U16.size
+    signatures = []
+    for _ in range(count):
+        (size,) = U16.unpack_from(view, offset)
+        offset += U16.size
+        signatures.append(_utf8_decode(view[offset:offset + size])[0])
+        offset += size
+
+    (count,) = U32.unpack_from(view, offset)
+    offset += U32.size
+    transactions = []
+    for _ in range(count):
+        tx, offset = _read_transaction(view, offset, Transaction)
+        transactions.append(tx)
+
+    block = Block(index=index, transactions=transactions, timestamp=timestamp,
+                  previous_hash=previous_hash, nonce=nonce, signatures=signatures,
+                  consensus_method=consensus_method, merkle_root=merkle_root,
+                  bits=bits, version=version)
+    block.hash = block_hash
+    if block_hash is not None:
+        block.seal()
+    return block, offset
+
+
+def _decode(reader, data, what):
+    view = memoryview(data)
+    try:
+        value, end = reader(view)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise CodecError(f"Malformed {what}: {e}")
+    if end > len(view):
+        raise CodecError(f"Truncated {what}")
+    if end < len(view):
+        raise CodecError(f"Trailing bytes after {what}")
+    return value
+
+
+def decode_transaction(data):
+    """Decode a transaction encoded by encode_transaction."""
+    return _decode(read_transaction, data, "transaction")
+
+
+def decode_block(data):
+    """Decode a block encoded by encode_block."""
+    return _decode(read_block, data, "block")
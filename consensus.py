@@ -1,61 +1,85 @@
 import time
-import json
 import random
-import hashlib
-from blockchain import Block
+from blockchain import Block, Transaction, MAX_NONCE, MAX_BLOCK_SIZE
+from template import build_block
+from mining import ParallelMiner, NONCE_CHUNK, search_range
 from stake import StakeManager
 from typing import Tuple
 
-DIFFICULTY_PREFIX = "0000"  # Low difficulty for faster demonstration
 
 class ProofOfWork:
     """
     A simple Proof-of-Work mechanism.
+    With workers > 1 the nonce search is spread over a process pool.
     """
 
-    def mine_block(self, blockchain, miner_address):
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.miner = ParallelMiner(workers) if workers > 1 else None
+
+    def build_template(self, blockchain, miner_address):
+        """
+        Build the next block (without a valid nonce yet) from the current
+        tip and pending transactions.
+        """
+        # Very naive coin reward
+        reward_transaction = Transaction("NETWORK", miner_address, 1)
+        return build_block(blockchain, "pow", reward_transaction, bits=blockchain.difficulty.next_bits())
+
+    def search(self, block, should_stop=None):
+        """
+        Search for a nonce that meets the block's target.
+        Returns (nonce, hash), or (None, None) if should_stop() turned true.
+        """
+        if self.miner:
+            return self.miner.search(block, should_stop)
+
+        header_prefix, target = block.header_prefix(), block.target
+        if not should_stop:
+            nonce, block_hash, _ = search_range(header_prefix, target, 0, MAX_NONCE)
+            return nonce, block_hash
+
+        # Search in chunks so we can notice a stop request in between
+        start = 0
+        while not should_stop():
+            nonce, block_hash, _ = search_range(header_prefix, target, start, start + NONCE_CHUNK)
+            if nonce is not None:
+                return nonce, block_hash
+            start += NONCE_CHUNK
+        return None, None
+
+    def mine_block(self, blockchain, miner_address, should_stop=None):
         """
         Mines a new block by incrementing nonce until the block's hash
         meets the difficulty requirement.
+
+        If new transactions arrive or the tip changes while mining, the
+        template is stale: the search is abandoned and restarted on a fresh
+        template. Returns None if should_stop() turns true first.
         """
-        last_block = blockchain.get_last_block()
-        index = len(blockchain.chain)
-        transactions = blockchain.current_transactions.copy()
+        while True:
+            with blockchain.lock:
+                template_version = blockchain.version
+                block = self.build_template(blockchain, miner_address)
 
-        block = Block(
-            index=index,
-            transactions=transactions,
-            timestamp=time.time(),
-            previous_hash=last_block.hash,
-            consensus_method="pow"
-        )
+            def stale_or_stopped():
+                return blockchain.version != template_version or bool(should_stop and should_stop())
 
-        # Very naive coin reward
-        reward_transaction = {
-            "sender": "NETWORK",
-            "recipient": miner_address,
-            "amount": 1,
-            "signature": None
-        }
-        block.transactions.append(reward_transaction)
+            block.nonce, block.hash = self.search(block, stale_or_stopped)
+            if block.nonce is None:
+                if should_stop and should_stop():
+                    return None
+                continue
 
-        nonce = 0
-        while True:
-            block.nonce = nonce
-            block_hash = block.compute_hash()
-            if block_hash.startswith(DIFFICULTY_PREFIX):
-                block.hash = block_hash
-                break
-            nonce += 1
-
-        # Add block to the chain
-        added = blockchain.add_block(block)
-        if added:
-            # Clear out the transaction pool
-            blockchain.clear_transactions()
-            return block
-        else:
-            return None
+            with blockchain.lock:
+                if blockchain.version != template_version:
+                    continue
+                # Add block to the chain
+                added = blockchain.add_block(block)
+                if added:
+                    return block
+                else:
+                    return None
 
 
 class TendermintBFT:
@@ -73,7 +97,7 @@ class TendermintBFT:
         # Temporary storage for demo purposes (Not suitable for real apps)
         self.current_proposal = None
         self.current_votes = None
-        self.MAX_BLOCK_SIZE = 1024 * 1024  # 1MB
+        self.MAX_BLOCK_SIZE = MAX_BLOCK_SIZE  # 1MB
         self.MAX_TIMESTAMP_DRIFT = 300  # 5 minutes
 
     def propose_block(self, blockchain):
@@ -82,21 +106,12 @@ class TendermintBFT:
         Stores the proposal internally for the voting step.
         """
         proposer = self.validators[self.round_robin_index]
-        last_block = blockchain.get_last_block()
-        index = len(blockchain.chain)
-        transactions = blockchain.current_transactions.copy()
-
-        proposed_block = Block(
-            index=index,
-            transactions=transactions,
-            timestamp=time.time(),
-            previous_hash=last_block.hash,
-            nonce=0,
-            signatures=[],
-            consensus_method="bft"
-        )
-        # Calculate hash now, it's needed for voting reference
-        proposed_block.hash = proposed_block.compute_hash()
+        # Leave room for every validator's vote, which is attached later
+        proposed_block = build_block(blockchain, "bft", signers=self.validators,
+                                     max_size=self.MAX_BLOCK_SIZE)
+        # Calculate hash now, it's needed for voting reference; sealing also
+        # means every validator's checks reuse the same hash and size
+        proposed_block.seal()
 
         # Store proposal for subsequent steps (demo only)
         self.current_proposal = {
@@ -132,7 +147,7 @@ class TendermintBFT:
             return False, f"Invalid proposer. Expected {expected_proposer}, got {proposer}"
 
         # 3. Check block size
-        block_size = len(json.dumps(block.to_dict()).encode())
+        block_size = block.size()
         if block_size > self.MAX_BLOCK_SIZE:
             return False, "Block size too large"
 
@@ -140,24 +155,32 @@ class TendermintBFT:
         seen_txs = set()  # For duplicate detection
         for tx in block.transactions:
             # Skip validation for reward transactions
-            if tx.get('sender') == 'NETWORK':
+            if tx.sender == 'NETWORK':
                 continue
 
             # Check for duplicate transactions
-            tx_hash = hashlib.sha256(json.dumps(tx, sort_keys=True).encode()).hexdigest()
+            tx_hash = tx.txid
             if tx_hash in seen_txs:
                 return False, "Duplicate transaction detected"
             seen_txs.add(tx_hash)
 
+            # ...and for replays of recently mined ones
+            if tx_hash in blockchain.recent:
+                return False, "Transaction is already on the chain"
+
             # In a real system, we would also:
-            # - Verify transaction signatures
             # - Check sender balances
             # - Verify transaction format
-            # - Check for double-spending against chain history
 
-        # 5. Verify block hash
-        if block.hash != block.compute_hash():
-            return False, "Invalid block hash"
+        # 5. Verify the Merkle root and block hash
+        if not blockchain.is_valid_block(block):
+            return False, "Invalid Merkle root or block hash"
+
+        # 6. Verify transaction signatures, all at once (the costly part)
+        if blockchain.verifier is not None:
+            position = blockchain.verifier.first_invalid(block.transactions)
+            if position is not None:
+                return False, f"Invalid signature on transaction {position}"
 
         return True, "Block is valid"
 
@@ -206,7 +229,6 @@ class TendermintBFT:
             # Add block to the actual chain
             added = blockchain.add_block(block_to_commit)
             if added:
-                blockchain.clear_transactions()
                 proposer = self.current_proposal['proposer']
                 message = f"Consensus reached! Block {block_to_commit.index} committed by {proposer}."
                 result_block = block_to_commit
@@ -236,9 +258,15 @@ class ProofOfStake:
     """
     A simple Proof of Stake mechanism.
     Validators are selected based on their stake to create new blocks.
+
+    Stakes are held under validator names; `reward_address` maps a name to
+    the address its block rewards are paid to (None if it has none), since
+    only an address derived from a key can spend them. By default the name
+    itself is used.
     """
-    def __init__(self):
+    def __init__(self, reward_address=None):
         self.stake_manager = StakeManager()
+        self.reward_address = reward_address if reward_address is not None else (lambda validator: validator)
         # For demo, add some initial stakes
         self._add_initial_stakes()
 
@@ -272,7 +300,7 @@ class ProofOfStake:
         """
         # Get last block hash as seed for deterministic selection
         last_block = blockchain.get_last_block()
-        seed = last_block.hash.encode('utf-8')
+        seed = last_block.hash
 
         # Select validator if not provided
         if not validator_address:
@@ -285,29 +313,15 @@ class ProofOfStake:
                 return None, f"Address {validator_address} is not an eligible validator"
             stake = self.stake_manager.get_stake(validator_address)
 
-        # Create the new block
-        index = len(blockchain.chain)
-        transactions = blockchain.current_transactions.copy()
-
         # Add validator reward (proportional to stake)
         reward = min(1.0, stake / 100.0)  # Max 1.0 reward, scales with stake
-        reward_tx = {
-            "sender": "NETWORK",
-            "recipient": validator_address,
-            "amount": reward,
-            "signature": None,
-            "type": "pos_reward"
-        }
-        transactions.append(reward_tx)
+        recipient = self.reward_address(validator_address)
+        if recipient is None:
+            return None, f"Validator {validator_address} has no address to pay its reward to"
+        reward_tx = Transaction("NETWORK", recipient, reward, tx_type="pos_reward")
 
         # Create and add the block
-        new_block = Block(
-            index=index,
-            transactions=transactions,
-            timestamp=time.time(),
-            previous_hash=last_block.hash,
-            consensus_method="pos"  # Mark as PoS block
-        )
+        new_block = build_block(blockchain, "pos", reward_tx)
         
         # Instead of PoW, we'll use a simple hash
         new_block.hash = new_block.compute_hash()
@@ -315,7 +329,6 @@ class ProofOfStake:
         # Try to add to chain
         added = blockchain.add_block(new_block)
         if added:
-            blockchain.clear_transactions()
             return new_block, f"Block created by validator {validator_address} (stake: {stake})"
         
         return None, "Failed to add block to chain"
@@ -0,0 +1,134 @@
+"""
+Numeric Proof-of-Work targets and difficulty retargeting.
+
+A PoW block is valid when its 256-bit hash, read as a big-endian integer, is
+at most the block's target. Targets are stored in block headers in the
+4-byte "compact" form used by Bitcoin: one exponent byte followed by a
+three-byte mantissa, target = mantissa * 256 ** (exponent - 3).
+
+Every RETARGET_INTERVAL PoW blocks the network hash rate is estimated from
+the last RETARGET_WINDOW PoW blocks (the work they represent divided by the
+time they took) and the target is set so that this hash rate would find a
+block every TARGET_BLOCK_TIME seconds. Keeping the window longer than the
+retarget interval smooths out the randomness of individual block times.
+"""
+from collections import deque
+
+# Easiest target allowed; equal to the old "0000" hex prefix rule
+POW_LIMIT = 1 << 240
+# Number of PoW blocks between retargets
+RETARGET_INTERVAL = 10
+# Number of recent PoW blocks the hash rate is estimated from
+RETARGET_WINDOW = 40
+# Desired seconds between PoW blocks
+TARGET_BLOCK_TIME = 10.0
+# A single retarget moves the target by at most this factor either way
+MAX_ADJUSTMENT = 4
+
+
+def target_to_bits(target: int) -> int:
+    """Encode a target in compact form (rounding down)."""
+    size = (target.bit_length() + 7) // 8
+    if size <= 3:
+        mantissa = target << (8 * (3 - size))
+    else:
+        mantissa = target >> (8 * (size - 3))
+    # The mantissa is unsigned here, but keep Bitcoin's rule that its top
+    # bit is clear so the encoding stays compatible
+    if mantissa & 0x800000:
+        mantissa >>= 8
+        size += 1
+    return (size << 24) | mantissa
+
+
+def bits_to_target(bits: int) -> int:
+    """Decode a compact target."""
+    size = bits >> 24
+    mantissa = bits & 0x7fffff
+    if size <= 3:
+        return mantissa >> (8 * (3 - size))
+    return mantissa << (8 * (size - 3))
+
+
+def hash_meets_target(digest: bytes, target: int) -> bool:
+    return int.from_bytes(digest, 'big') <= target
+
+
+def target_work(target: int) -> int:
+    """Expected number of hashes needed to find a block at `target`."""
+    return (1 << 256) // (target + 1)
+
+
+INITIAL_BITS = target_to_bits(POW_LIMIT)
+
+
+class DifficultyAdjuster:
+    """
+    Keeps a rolling window of (timestamp, work) for recent PoW blocks, with
+    a running total of the work in it, and retargets every `interval` PoW
+    blocks. Each block is observed once as it is added, so neither the
+    chain nor the window is ever rescanned.
+    """
+
+    def __init__(self, initial_bits=INITIAL_BITS, interval=RETARGET_INTERVAL,
+                 window=RETARGET_WINDOW, block_time=TARGET_BLOCK_TIME, pow_limit=POW_LIMIT):
+        self.bits = initial_bits
+        self.interval = interval
+        self.block_time = block_time
+        self.pow_limit = pow_limit
+        self.window = deque(maxlen=window)
+        # Work of every block in the window except the oldest, whose time
+        # to be found falls before the window starts
+        self.window_work = 0
+        self.pow_blocks = 0
+
+    def next_bits(self) -> int:
+        """Compact target the next PoW block must use."""
+        return self.bits
+
+    def next_target(self) -> int:
+        return bits_to_target(self.bits)
+
+    def observe(self, block):
+        """Record a block that was added to the chain."""
+        if block.consensus_method != "pow":
+            return
+        work = target_work(bits_to_target(block.bits))
+        if len(self.window) == self.window.maxlen:
+            self.window.popleft()
+            # The new oldest block no longer counts
+            self.window_work -= self.window[0][1]
+        if self.window:
+            self.window_work += work
+        self.window.append((block.timestamp, work))
+        self.pow_blocks += 1
+        if self.pow_blocks % self.interval == 0 and len(self.window) > 1:
+            self.retarget()
+
+    def snapshot(self):
+        """
+        What observe() is about to overwrite, so unobserve() can restore it.
+        Take it right before observing the block.
+        """
+        evicted = self.window[0] if len(self.window) == self.window.maxlen else None
+        return self.bits, self.window_work, self.pow_blocks, evicted
+
+    def unobserve(self, block, snapshot):
+        """Take the last block observed back out (for a reorg)."""
+        if block.consensus_method != "pow":
+            return
+        self.bits, self.window_work, self.pow_blocks, evicted = snapshot
+        self.window.pop()
+        if evicted is not None:
+            self.window.appendleft(evicted)
+
+    def retarget(self):
+        elapsed = self.window[-1][0] - self.window[0][0]
+        current = self.next_target()
+        if elapsed <= 0:
+            new_target = current // MAX_ADJUSTMENT
+        else:
+            hash_rate = self.window_work / elapsed
+            new_target = int((1 << 256) / (hash_rate * self.block_time)) - 1
+            new_target = min(max(new_target, current // MAX_ADJUSTMENT), current * MAX_ADJUSTMENT)
+        self.bits = target_to_bits(min(max(new_target, 1), self.pow_limit))
@@ -0,0 +1,88 @@
+"""
+Public keys and the addresses derived from them.
+
+A transfer carries its sender's public key, as a compressed P-256 point
+(33 bytes). The sender's address is derived from the key: the first 20
+bytes of its SHA-256, as hex. A signature only counts if the key that made
+it hashes to the sender's address, so a key can only spend from its own
+address.
+
+Turning the 33 bytes back into a key object means decompressing the point,
+which costs about a third of checking a signature. A busy sender sends
+many transactions, so PublicKeyCache keeps the loaded keys of the most
+recent senders.
+"""
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+ADDRESS_SIZE = 20
+ADDRESS = re.compile(r"[0-9a-f]{%d}$" % (2 * ADDRESS_SIZE))
+# Loaded keys PublicKeyCache keeps
+KEY_CACHE_SIZE = 10_000
+
+
+def public_key_bytes(public_key) -> bytes:
+    """A public key as a compressed curve point (33 bytes for P-256)."""
+    return public_key.public_bytes(serialization.Encoding.X962, serialization.PublicFormat.CompressedPoint)
+
+
+def address_of(data: bytes) -> str:
+    """The address of the key whose compressed point is `data`."""
+    return hashlib.sha256(data).digest()[:ADDRESS_SIZE].hex()
+
+
+def is_address(value: str) -> bool:
+    """Whether `value` has the form of a derived address."""
+    return ADDRESS.match(value) is not None
+
+
+def load_public_key(data: bytes):
+    """The key object for a compressed point. Raises ValueError if it isn't one."""
+    return ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), data)
+
+
+class PublicKeyCache:
+    """
+    Loaded public keys by compressed point, the newest `capacity` of them
+    (least recently used dropped first), with hit and miss counts.
+    Thread-safe.
+    """
+
+    def __init__(self, capacity=KEY_CACHE_SIZE):
+        self.capacity = capacity
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, data: bytes):
+        """The key object for `data`, or None if it isn't a valid key."""
+        with self._lock:
+            public_key = self._keys.get(data)
+            if public_key is not None:
+                self._keys.move_to_end(data)
+                self.hits += 1
+                return public_key
+            self.misses += 1
+        # Loaded outside the lock: it is the slow part
+        try:
+            public_key = load_public_key(data)
+        except ValueError:
+            return None
+        with self._lock:
+            self._keys[data] = public_key
+            if len(self._keys) > self.capacity:
+                self._keys.popitem(last=False)
+        return public_key
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self._keys), "capacity": self.capacity, "hits": self.hits,
+                "misses": self.misses, "hit_rate": self.hits / lookups if lookups else None}
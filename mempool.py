@@ -0,0 +1,367 @@
+"""
+The pool of transactions waiting to go into a block.
+
+Transactions are kept in fee-rate order: the fee divided by the size of the
+transaction's canonical encoding, so a block of limited size earns the most
+by taking the highest rates first. The pool is bounded by a count and a
+byte cap; once either is reached, a new transaction has to pay a higher
+rate than the cheapest one in the pool, which is evicted to make room.
+
+Entries live in a dict keyed by transaction id, plus two heaps over the same
+entries: a max-heap by fee rate to pick transactions for a block, and a
+min-heap to find what to evict. Removing a transaction only drops it from
+the dict and marks its entry; heap items for removed entries are skipped
+when they surface, and the heaps are rebuilt once most of their items are
+stale. Adding and removing are O(log n) (amortised).
+
+Transactions expire `ttl` seconds after they were admitted. Since the TTL
+is the same for everyone, they expire in the order they arrived: a FIFO
+queue of entries in admission order is enough, and expire() only ever
+looks at its head, popping entries that have expired (or already left the
+pool), so each entry is visited once.
+
+Each sender's transactions are also kept in a SenderQueue, by nonce, with
+the total they would spend. Admission is O(1) per sender: a nonce the
+chain has already used, a nonce that is already pending, or a transaction
+that would take the sender's pending spending past its balance is turned
+away. A nonce past the sender's next one is parked: it stays in the pool
+but can't be mined until the nonces before it arrive. Only the head of
+each queue (the transaction with the nonce the chain expects next) is
+ranked in the fee-rate heap; by_priority follows each head it yields to
+the sender's next nonce, so it only ever yields contiguous runs.
+
+RecentTransactions remembers the ids of the transactions in the newest
+blocks, so a transaction that was just mined can be turned away when it is
+submitted again, without looking through the chain.
+"""
+import time
+import heapq
+import itertools
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional
+
+MAX_COUNT = 50_000
+MAX_BYTES = 32 * 1024 * 1024
+# Pending transactions a single sender may have
+MAX_PER_SENDER = 1000
+# Seconds a transaction may wait for a block
+TTL = 3600
+# Blocks whose transaction ids RecentTransactions keeps
+RECENT_BLOCKS = 1000
+
+
+class MempoolError(ValueError):
+    """Raised when a transaction is not admitted to the pool."""
+
+
+class MempoolEntry:
+    __slots__ = ('tx', 'txid', 'size', 'fee_rate', 'sequence', 'added', 'queue', 'ranked', 'removed')
+
+    def __init__(self, tx, txid, size, sequence, added, queue):
+        self.tx = tx
+        self.txid = txid
+        self.size = size
+        self.fee_rate = tx.fee / size
+        self.sequence = sequence
+        self.added = added  # admission time (time.time())
+        self.queue = queue  # the sender's SenderQueue
+        self.ranked = False  # pushed onto the fee-rate heap
+        self.removed = False
+
+
+class SenderQueue:
+    """One sender's pending transactions by nonce, and their total cost."""
+    __slots__ = ('entries', 'next_nonce', 'spend')
+
+    def __init__(self, next_nonce):
+        self.entries: Dict[int, MempoolEntry] = {}
+        self.next_nonce = next_nonce  # the sender's next nonce on the chain
+        self.spend = 0  # amounts plus fees of the pending transactions
+
+
+class Mempool:
+    """
+    Pending transactions, bounded by `max_count` entries and `max_bytes`
+    of encoded transactions, and `max_per_sender` per sender. Not
+    thread-safe: Blockchain guards it with its lock.
+    """
+
+    def __init__(self, max_count=MAX_COUNT, max_bytes=MAX_BYTES, ttl=TTL, max_per_sender=MAX_PER_SENDER):
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_per_sender = max_per_sender
+        # A MempoolJournal to log admissions and removals to, if any
+        self.journal = None
+        self.entries: Dict[bytes, MempoolEntry] = {}
+        self.senders: Dict[str, SenderQueue] = {}
+        self.bytes = 0
+        # (-fee rate, sequence, entry) of queue heads: best first, oldest
+        # first on ties
+        self._best = []
+        # (fee rate, -sequence, entry): cheapest first, newest first on ties
+        self._worst = []
+        self._sequence = itertools.count()
+        # Entries in admission order, for expiry
+        self._arrivals = deque()
+        # What has happened to transactions so far, for /stats
+        self.counters = {"admitted": 0, "included": 0, "evicted": 0, "expired": 0, "removed": 0}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, txid):
+        return txid in self.entries
+
+    def add(self, tx, added: Optional[float] = None, next_nonce: int = 0,
+            balance: Optional[float] = None) -> MempoolEntry:
+        """
+        Admit a transaction, evicting lower-paying ones if the pool is full.
+        `added` is the admission time, if not now (e.g. when restoring).
+        `next_nonce` and `balance` are the sender's on the chain; with no
+        balance, spending isn't checked. Raises MempoolError if it is
+        already in the pool, has expired, reuses a nonce, would overdraw
+        the sender, or is too big or too cheap to get in.
+        """
+        txid = tx.txid
+        if txid in self.entries:
+            raise MempoolError("Transaction is already pending")
+        added = time.time() if added is None else added
+        if added + self.ttl <= time.time():
+            raise MempoolError("Transaction has expired")
+
+        sender = tx.sender
+        nonce = tx.nonce
+        queue = self.senders.get(sender)
+        if queue is None:
+            queue = SenderQueue(next_nonce)
+        elif queue.next_nonce != next_nonce:
+            self._rebase(queue, next_nonce)
+        if nonce < next_nonce:
+            raise MempoolError(f"Nonce {nonce} has already been used: {sender}'s next nonce is {next_nonce}")
+        if nonce in queue.entries:
+            raise MempoolError(f"{sender} already has a pending transaction with nonce {nonce}")
+        if len(queue.entries) >= self.max_per_sender:
+            raise MempoolError(f"{sender} already has {len(queue.entries)} pending transactions")
+        cost = tx.amount + tx.fee
+        if balance is not None and queue.spend + cost > balance:
+            raise MempoolError(f"Insufficient balance: {sender} would spend {queue.spend + cost} "
+                               f"with a balance of {balance}")
+
+        entry = MempoolEntry(tx, txid, len(tx.to_bytes()), next(self._sequence), added, queue)
+        if entry.size > self.max_bytes:
+            raise MempoolError("Transaction is larger than the pool")
+
+        # Make room, cheapest first, but only ever for a better-paying entry
+        evict = []
+        count, size = len(self.entries) + 1, self.bytes + entry.size
+        while count > self.max_count or size > self.max_bytes:
+            item = heapq.heappop(self._worst)
+            if item[2].removed:
+                continue
+            evict.append(item)
+            if item[2].fee_rate >= entry.fee_rate:
+                # Not worth it: put the candidates back
+                for candidate in evict:
+                    heapq.heappush(self._worst, candidate)
+                raise MempoolError(f"Mempool is full: fee rate must beat {item[0]:.6g} per byte")
+            count -= 1
+            size -= item[2].size
+        for item in evict:
+            self._drop(item[2], "evicted")
+
+        self.entries[txid] = entry
+        self.senders[sender] = queue
+        queue.entries[nonce] = entry
+        queue.spend += cost
+        self.bytes += entry.size
+        if nonce == queue.next_nonce:
+            self._rank(entry)
+        heapq.heappush(self._worst, (entry.fee_rate, -entry.sequence, entry))
+        self._arrivals.append(entry)
+        self.counters["admitted"] += 1
+        if self.journal is not None:
+            self.journal.log_add(tx, added)
+            # Evictions add records too; without blocks arriving, this is
+            # what keeps the journal from growing without bound
+            self.journal.maybe_compact(self)
+        return entry
+
+    def remove(self, txid: bytes, reason="removed") -> bool:
+        """Drop a transaction if it is pending. Returns whether it was."""
+        entry = self.entries.get(txid)
+        if entry is None:
+            return False
+        self._drop(entry, reason)
+        return True
+
+    def remove_included(self, transactions: Iterable) -> int:
+        """
+        Drop the transactions a block included, leaving everything else
+        (including transactions that arrived while it was being built).
+        Pending transactions that reuse a nonce the block took are dropped
+        too, and each sender's next nonce becomes the head of its queue.
+        Returns how many were removed.
+        """
+        removed = 0
+        for tx in transactions:
+            queue = self.senders.get(tx.sender)
+            if queue is None:
+                continue
+            entry = queue.entries.get(tx.nonce)
+            if entry is not None and entry.txid == tx.txid:
+                self._drop(entry, "included")
+                removed += 1
+            if tx.nonce >= queue.next_nonce:
+                self._rebase(queue, tx.nonce + 1)
+        if self.journal is not None:
+            self.journal.maybe_compact(self)
+        return removed
+
+    def next_nonce(self, sender: str, next_nonce: int) -> int:
+        """
+        The nonce after the sender's pending run: `next_nonce` (its next
+        nonce on the chain) plus however many contiguous nonces from there
+        are pending.
+        """
+        queue = self.senders.get(sender)
+        if queue is not None:
+            while next_nonce in queue.entries:
+                next_nonce += 1
+        return next_nonce
+
+    def by_priority(self) -> Iterator:
+        """
+        Yield pending transactions best fee rate first, each sender's in
+        nonce order, without changing the pool. Walks the heap of queue
+        heads as a tree, and follows each head it yields to the sender's
+        next nonce, so taking the first k costs O(k log k) however big the
+        pool is. Parked transactions (after a gap) are never yielded.
+        """
+        heap = self._best
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier:
+            item, position = heapq.heappop(frontier)
+            entry = item[2]
+            if position >= 0:
+                for child in (2 * position + 1, 2 * position + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], child))
+                # Only a current head starts a run
+                if entry.removed or entry.tx.nonce != entry.queue.next_nonce:
+                    continue
+            yield entry.tx
+            successor = entry.queue.entries.get(entry.tx.nonce + 1)
+            if successor is not None:
+                heapq.heappush(frontier, ((-successor.fee_rate, successor.sequence, successor), -1))
+
+    def transactions(self) -> List:
+        """Every minable pending transaction, best fee rate first."""
+        return list(self.by_priority())
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Drop the transactions whose TTL has run out. Returns how many."""
+        deadline = (time.time() if now is None else now) - self.ttl
+        arrivals = self._arrivals
+        expired = 0
+        while arrivals and (arrivals[0].removed or arrivals[0].added <= deadline):
+            entry = arrivals.popleft()
+            if not entry.removed:
+                self._drop(entry, "expired")
+                expired += 1
+        if expired and self.journal is not None:
+            self.journal.maybe_compact(self)
+        return expired
+
+    def _rank(self, entry: MempoolEntry):
+        """Put a queue head on the fee-rate heap, unless it already is."""
+        if not entry.ranked:
+            entry.ranked = True
+            heapq.heappush(self._best, (-entry.fee_rate, entry.sequence, entry))
+
+    def _rebase(self, queue: SenderQueue, next_nonce: int):
+        """
+        Move a sender's queue to the chain's next nonce for it: pending
+        transactions below it can never be mined and are dropped, and the
+        transaction at it (if any) becomes the head. The nonce goes down
+        when a reorg takes the sender's transactions back off the chain.
+        """
+        if next_nonce > queue.next_nonce:
+            if next_nonce - queue.next_nonce < len(queue.entries):
+                stale = [queue.entries[nonce] for nonce in range(queue.next_nonce, next_nonce)
+                         if nonce in queue.entries]
+            else:
+                stale = [entry for nonce, entry in queue.entries.items() if nonce < next_nonce]
+            for entry in stale:
+                self._drop(entry, "removed")
+        queue.next_nonce = next_nonce
+        head = queue.entries.get(next_nonce)
+        if head is not None:
+            self._rank(head)
+
+    def _drop(self, entry: MempoolEntry, reason):
+        del self.entries[entry.txid]
+        self.bytes -= entry.size
+        entry.removed = True
+        queue = entry.queue
+        del queue.entries[entry.tx.nonce]
+        queue.spend -= entry.tx.amount + entry.tx.fee
+        if not queue.entries and self.senders.get(entry.tx.sender) is queue:
+            del self.senders[entry.tx.sender]
+        self.counters[reason] += 1
+        if self.journal is not None:
+            self.journal.log_remove(entry.txid)
+        # Rebuild the heaps once they are mostly stale items
+        if len(self._best) > 2 * len(self.entries) + 64:
+            self._best = [item for item in self._best if not item[2].removed]
+            heapq.heapify(self._best)
+        if len(self._worst) > 2 * len(self.entries) + 64:
+            self._worst = [item for item in self._worst if not item[2].removed]
+            heapq.heapify(self._worst)
+        if len(self._arrivals) > 2 * len(self.entries) + 64:
+            self._arrivals = deque(entry for entry in self._arrivals if not entry.removed)
+
+
+class RecentTransactions:
+    """
+    The ids of the transactions in the newest `depth` blocks: a set that
+    blocks roll through, with a count per id (identical reward transactions
+    can appear in several blocks). Lookups are O(1); adding or removing a
+    block costs its transaction count.
+    """
+
+    def __init__(self, depth=RECENT_BLOCKS):
+        self.depth = depth
+        self.counts: Dict[bytes, int] = {}
+        # (height, txids) of each block in the window, oldest first
+        self.blocks = deque()
+
+    def __contains__(self, txid):
+        return txid in self.counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add_block(self, block):
+        counts = self.counts
+        # Not tx.txid: that would keep an id on every transaction replayed
+        # at startup long after it has left the window
+        txids = [tx.compute_txid() for tx in block.transactions]
+        for txid in txids:
+            counts[txid] = counts.get(txid, 0) + 1
+        self.blocks.append((block.index, txids))
+        while len(self.blocks) > self.depth:
+            self._forget(self.blocks.popleft()[1])
+
+    def remove_block(self, block):
+        """Undo add_block for the newest block (when it is disconnected)."""
+        if self.blocks and self.blocks[-1][0] == block.index:
+            self._forget(self.blocks.pop()[1])
+
+    def _forget(self, txids):
+        counts = self.counts
+        for txid in txids:
+            if counts[txid] == 1:
+                del counts[txid]
+            else:
+                counts[txid] -= 1
@@ -0,0 +1,271 @@
+"""
+Write-ahead journal that lets the mempool survive a restart.
+
+Every transaction admitted to the mempool is appended to a journal file as
+an ADD record (its admission time and canonical encoding, so its TTL keeps
+running across restarts), and every transaction that leaves it (mined,
+evicted, expired) as a REMOVE record (its 32-byte id). Records are framed
+like block_store records: payload length, CRC32, payload.
+
+Group commit: callers only queue their record and return. A writer thread
+takes everything queued, writes it with one write() and one fsync(), and
+wakes whoever is waiting for it; records queued during an fsync go out
+together in the next one. /transactions/new waits for its record to be
+durable, so a burst of submissions shares fsyncs instead of paying one
+each.
+
+Compaction: once the journal holds several times more records than the
+mempool has transactions, the writer switches to a new journal file (the
+files are numbered: journal-00000001.log, ...) and a background thread
+writes the pending transactions as of the switch to snapshot.dat. The
+snapshot records the last journal it covers, and older journals are then
+deleted. Startup streams the snapshot, replays the journals after it and
+folds them into a new snapshot, so each restart leaves one journal behind
+rather than adding one. A torn record at the end of a journal (a crash mid-write) ends the replay.
+"""
+import os
+import re
+import zlib
+import struct
+import threading
+from codec import decode_transaction, CodecError
+from mempool import MempoolError
+
+RECORD_HEADER = struct.Struct(">II")  # payload length, CRC32 of payload
+SNAPSHOT_HEADER = struct.Struct(">4sQ")  # magic, last journal covered
+SNAPSHOT_MAGIC = b"MPSN"
+SNAPSHOT_FILE = "snapshot.dat"
+ADDED = struct.Struct(">d")  # admission time, before the transaction
+JOURNAL_FILE = re.compile(r"journal-(\d{8})\.log$")
+
+ADD = b"\x01"
+REMOVE = b"\x02"
+
+# Compact once the journal has this many records per pending transaction...
+COMPACT_RATIO = 4
+# ...and at least this many records
+MIN_COMPACT_RECORDS = 10_000
+
+
+def _frame(payload: bytes) -> bytes:
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_records(f):
+    """Yield record payloads from a file until its end or a torn record."""
+    while True:
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        length, crc = RECORD_HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        yield payload
+
+
+class MempoolJournal:
+    """
+    The journal and snapshot of a mempool, in `directory`. Call restore()
+    once at startup; after that the mempool logs its changes here.
+    """
+
+    def __init__(self, directory, fsync=True, compact_ratio=COMPACT_RATIO,
+                 min_compact_records=MIN_COMPACT_RECORDS):
+        self.directory = directory
+        self.fsync = fsync
+        self.compact_ratio = compact_ratio
+        self.min_compact_records = min_compact_records
+        os.makedirs(directory, exist_ok=True)
+
+        self._cond = threading.Condition()
+        # Framed records (bytes) and rotation markers (lists of (admission
+        # time, transaction)) waiting for the writer
+        self._queue = []
+        self._queued = 0  # records queued so far
+        self._durable = 0  # records written (and fsynced) so far
+        self._records = 0  # records in the current journal file
+        self._compacting = False
+        self._closed = False
+        self._file = None
+        self._generation = 0
+        self._writer = None
+
+    # --- paths ---
+
+    def _journal_path(self, generation):
+        return os.path.join(self.directory, f"journal-{generation:08d}.log")
+
+    def _journals(self):
+        """Generations of the journal files on disk, oldest first."""
+        found = (JOURNAL_FILE.match(name) for name in os.listdir(self.directory))
+        return sorted(int(match.group(1)) for match in found if match)
+
+    # --- startup ---
+
+    def restore(self, blockchain) -> int:
+        """
+        Load the snapshot and replay the journals after it into
+        blockchain's mempool, write the result as the new snapshot (deleting
+        the replayed journals), then start journaling its changes. Returns
+        how many transactions are pending afterwards.
+        """
+        mempool = blockchain.mempool
+        mempool.journal = None
+        covered = 0
+
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                header = f.read(SNAPSHOT_HEADER.size)
+                if len(header) == SNAPSHOT_HEADER.size:
+                    magic, covered = SNAPSHOT_HEADER.unpack(header)
+                    if magic == SNAPSHOT_MAGIC:
+                        for payload in _read_records(f):
+                            self._replay_add(blockchain, payload)
+                    else:
+                        covered = 0
+
+        generations = self._journals()
+        for generation in generations:
+            if generation <= covered:
+                continue
+            with open(self._journal_path(generation), "rb") as f:
+                for payload in _read_records(f):
+                    if payload[:1] == ADD:
+                        self._replay_add(blockchain, payload[1:])
+                    elif payload[:1] == REMOVE:
+                        mempool.remove(bytes(payload[1:]))
+
+        # Fold what was replayed into a new snapshot, so journals don't pile
+        # up across restarts, and start a new journal rather than appending
+        # after a possibly torn one
+        last = max(generations + [covered])
+        if generations:
+            with blockchain.lock:
+                transactions = [(entry.added, entry.tx) for entry in mempool.entries.values()]
+            self._write_snapshot(transactions, last)
+        self._generation = last + 1
+        self._file = open(self._journal_path(self._generation), "ab")
+        self._writer = threading.Thread(target=self._write_loop, name="mempool-journal", daemon=True)
+        self._writer.start()
+        mempool.journal = self
+        return len(mempool)
+
+    def _replay_add(self, blockchain, payload):
+        try:
+            (added,) = ADDED.unpack_from(payload)
+            blockchain.add_transaction(decode_transaction(payload[ADDED.size:]), added)
+        except (struct.error, CodecError, MempoolError):
+            # Corrupt, or mined / evicted / already pending in the meantime
+            pass
+
+    # --- logging (called by the mempool, under the blockchain lock) ---
+
+    def log_add(self, tx, added: float):
+        self._enqueue(_frame(ADD + ADDED.pack(added) + tx.to_bytes()))
+
+    def log_remove(self, txid: bytes):
+        self._enqueue(_frame(REMOVE + txid))
+
+    def _enqueue(self, record):
+        with self._cond:
+            self._queue.append(record)
+            self._queued += 1
+            self._records += 1
+            self._cond.notify_all()
+
+    def maybe_compact(self, mempool):
+        """
+        Schedule a compaction if the journal has grown well past the
+        mempool. The pending transactions are captured now, in the same
+        queue position as the records, so the snapshot matches exactly the
+        journal it replaces.
+        """
+        with self._cond:
+            if self._compacting or self._records < max(self.min_compact_records,
+                                                       self.compact_ratio * len(mempool)):
+                return
+            self._compacting = True
+            self._records = 0
+            self._queue.append([(entry.added, entry.tx) for entry in mempool.entries.values()])
+            self._cond.notify_all()
+
+    def wait(self):
+        """Block until every record queued so far is on disk."""
+        with self._cond:
+            target = self._queued
+            while self._durable < target and not self._closed:
+                self._cond.wait()
+
+    # --- writer thread ---
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue and self._closed:
+                    return
+                batch, self._queue = self._queue, []
+
+            written = 0
+            chunk = []
+            for item in batch:
+                if isinstance(item, bytes):
+                    chunk.append(item)
+                    continue
+                # Rotation marker: finish the current journal, then switch
+                written += self._write(chunk)
+                chunk = []
+                self._rotate(item)
+            written += self._write(chunk)
+
+            with self._cond:
+                self._durable += written
+                self._cond.notify_all()
+
+    def _write(self, chunk):
+        if not chunk:
+            return 0
+        self._file.write(b"".join(chunk))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        return len(chunk)
+
+    def _rotate(self, transactions):
+        self._file.close()
+        covered = self._generation
+        self._generation += 1
+        self._file = open(self._journal_path(self._generation), "ab")
+        threading.Thread(target=self._write_snapshot, args=(transactions, covered),
+                         name="mempool-snapshot", daemon=True).start()
+
+    def _write_snapshot(self, transactions, covered):
+        """Write the snapshot covering journals up to `covered`, then drop them."""
+        try:
+            path = os.path.join(self.directory, SNAPSHOT_FILE)
+            temporary = path + ".tmp"
+            with open(temporary, "wb") as f:
+                f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, covered))
+                f.write(b"".join(_frame(ADDED.pack(added) + tx.to_bytes()) for added, tx in transactions))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(temporary, path)
+            for generation in self._journals():
+                if generation <= covered:
+                    os.remove(self._journal_path(generation))
+        finally:
+            with self._cond:
+                self._compacting = False
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._writer is not None:
+            self._writer.join()
+        if self._file is not None:
+            self._file.close()
@@ -0,0 +1,105 @@
+"""
+Merkle tree over a block's transactions.
+
+Leaves and inner nodes are hashed with different one-byte prefixes so a leaf
+can never be passed off as an inner node. When a level has an odd number of
+nodes, the last one is carried up to the next level unchanged.
+
+An inclusion proof is the list of sibling hashes on the path from a leaf to
+the root, so it holds O(log n) hashes no matter how large the block is.
+"""
+import hashlib
+from codec import encode_transaction
+
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+EMPTY_ROOT = bytes(32)
+
+
+def transaction_leaf(tx) -> bytes:
+    """Leaf hash of a Transaction."""
+    return hashlib.sha256(LEAF_PREFIX + encode_transaction(tx)).digest()
+
+
+def hash_pair(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def _next_level(level):
+    """Hash one level of the tree into the next, all pairs in one pass."""
+    sha256 = hashlib.sha256
+    next_level = [sha256(NODE_PREFIX + level[i] + level[i + 1]).digest()
+                  for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        next_level.append(level[-1])
+    return next_level
+
+
+class MerkleTree:
+    """
+    A Merkle tree that keeps every level, so proofs can be read off
+    without rehashing anything.
+    """
+
+    def __init__(self, leaves):
+        self.levels = [list(leaves)]
+        while len(self.levels[-1]) > 1:
+            self.levels.append(_next_level(self.levels[-1]))
+
+    @classmethod
+    def from_transactions(cls, transactions):
+        return cls([transaction_leaf(tx) for tx in transactions])
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    @property
+    def root(self) -> bytes:
+        if not self.levels[0]:
+            return EMPTY_ROOT
+        return self.levels[-1][0]
+
+    def proof(self, index):
+        """
+        Inclusion proof for the leaf at `index`: a list of
+        {'hash': hex, 'position': 'left' | 'right'} entries from the leaf
+        level up, where position tells which side the sibling is on.
+        """
+        if not 0 <= index < len(self):
+            raise IndexError(f"Leaf index {index} out of range")
+        path = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            # A promoted odd node has no sibling on this level
+            if sibling < len(level):
+                path.append({
+                    'hash': level[sibling].hex(),
+                    'position': 'left' if sibling < index else 'right'
+                })
+            index //= 2
+        return path
+
+
+def merkle_root(transactions) -> bytes:
+    """Merkle root (32 bytes) of a list of Transactions."""
+    return MerkleTree.from_transactions(transactions).root
+
+
+def verify_proof(leaf: bytes, proof, root: bytes) -> bool:
+    """
+    Check that `leaf` is included under `root` using a proof produced by
+    MerkleTree.proof.
+    """
+    current = leaf
+    for step in proof:
+        sibling = bytes.fromhex(step['hash'])
+        if step['position'] == 'left':
+            current = hash_pair(sibling, current)
+        else:
+            current = hash_pair(current, sibling)
+    return current == root
+
+
+def verify_transaction(tx, proof, root_hex: str) -> bool:
+    """Check that a Transaction is included under a hex Merkle root."""
+    return verify_proof(transaction_leaf(tx), proof, bytes.fromhex(root_hex))
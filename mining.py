@@ -0,0 +1,255 @@
+"""
+Parallel nonce search for Proof-of-Work.
+
+The nonce space is cut into fixed-size ranges ("chunks") that are handed out
+to a pool of worker processes. Workers only receive the block's fixed header
+prefix: they hash it once and, for every nonce, copy that SHA-256 state and
+feed it the eight nonce bytes, so the cost per hash does not depend on how
+many transactions the block holds. As soon as one worker finds a hash that
+meets the difficulty, a shared stop event tells the others to give up their
+ranges.
+
+Mining for the HTTP API runs as a MiningJob on a background thread, so the
+server keeps answering other requests while a block is being searched for.
+"""
+import os
+import time
+import uuid
+import hashlib
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from blockchain import Block, NONCE, MAX_NONCE
+
+# Number of nonces a worker searches before asking for a new range
+NONCE_CHUNK = 50_000
+# How often (in nonces) a worker checks whether it has been cancelled
+STOP_CHECK_INTERVAL = 1024
+# How often (in seconds) the coordinator checks whether to abandon a search
+STOP_POLL_INTERVAL = 0.05
+# Number of finished jobs kept around for status queries
+MAX_FINISHED_JOBS = 100
+
+# Set in each worker process by _init_worker
+_stop_event = None
+
+
+def _init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+
+def search_range(header_prefix: bytes, target: int, start, end):
+    """
+    Try every nonce in [start, end) until the header hashes to a value at
+    most `target`. Returns (nonce, hash, hashes_tried); nonce and hash are
+    None when the range is exhausted or the search was cancelled.
+    """
+    # Equal-length big-endian byte strings compare like the integers they encode
+    target_bytes = target.to_bytes(32, 'big')
+    midstate = hashlib.sha256(header_prefix)
+    nonce_bytes = bytearray(NONCE.size)
+    pack_nonce = NONCE.pack_into
+    for nonce in range(start, end):
+        if _stop_event is not None and (nonce - start) % STOP_CHECK_INTERVAL == 0 \
+                and _stop_event.is_set():
+            return None, None, nonce - start
+        pack_nonce(nonce_bytes, 0, nonce)
+        sha = midstate.copy()
+        sha.update(nonce_bytes)
+        digest = sha.digest()
+        if digest <= target_bytes:
+            return nonce, digest, nonce - start + 1
+    return None, None, end - start
+
+
+class ParallelMiner:
+    """
+    Searches the nonce space of a block across a pool of worker processes.
+    The pool is created on first use and reused for later blocks.
+    """
+
+    def __init__(self, workers=None, chunk_size=NONCE_CHUNK):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._ctx = mp.get_context()
+        self._stop_event = self._ctx.Event()
+        self._pool = None
+        # Statistics of the most recent search (hashes, seconds, hash_rate)
+        self.last_stats = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=self._ctx,
+                initializer=_init_worker,
+                initargs=(self._stop_event,)
+            )
+        return self._pool
+
+    def search(self, block: Block, should_stop=None, start_nonce=0, max_nonce=MAX_NONCE):
+        """
+        Find a nonce for `block` whose hash is at most `block.target`.
+        Returns (nonce, hash), or (None, None) if no nonce below `max_nonce`
+        meets the difficulty or `should_stop()` turned true first.
+        The block itself is not modified.
+        """
+        pool = self._get_pool()
+        header_prefix = block.header_prefix()
+        target = block.target
+        self._stop_event.clear()
+
+        next_start = start_nonce
+        pending = set()
+        result = (None, None)
+        hashes = 0
+        started = time.perf_counter()
+
+        def submit_next():
+            nonlocal next_start
+            if next_start >= max_nonce:
+                return
+            end = min(next_start + self.chunk_size, max_nonce)
+            pending.add(pool.submit(search_range, header_prefix, target, next_start, end))
+            next_start = end
+
+        # Keep one range in flight per worker; refill as ranges are exhausted
+        for _ in range(self.workers):
+            submit_next()
+
+        while pending:
+            done, pending = wait(pending, timeout=STOP_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                nonce, block_hash, tried = future.result()
+                hashes += tried
+                if nonce is not None and (result[0] is None or nonce < result[0]):
+                    result = (nonce, block_hash)
+            if result[0] is not None or (should_stop and should_stop()):
+                # Cancel everyone else and wait for them to hand back their ranges
+                self._stop_event.set()
+                for future in wait(pending).done:
+                    hashes += future.result()[2]
+                pending = set()
+                break
+            for _ in done:
+                submit_next()
+
+        elapsed = time.perf_counter() - started
+        self.last_stats = {
+            'workers': self.workers,
+            'hashes': hashes,
+            'seconds': elapsed,
+            'hash_rate': hashes / elapsed if elapsed > 0 else 0.0
+        }
+        return result
+
+    def close(self):
+        """Shut down the worker pool."""
+        if self._pool is not None:
+            self._stop_event.set()
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+class MiningJob:
+    """
+    One background attempt to mine a block for `miner_address`.
+    status is one of "running", "completed", "cancelled" or "failed".
+    """
+
+    def __init__(self, miner_address):
+        self.id = uuid.uuid4().hex
+        self.miner_address = miner_address
+        self.status = "running"
+        self.message = "Mining in progress"
+        self.block = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+        self.thread = None
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def finish(self, status, message, block=None):
+        self.status = status
+        self.message = message
+        self.block = block
+        self.finished_at = time.time()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'miner': self.miner_address,
+            'status': self.status,
+            'message': self.message,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'block': self.block.to_dict() if self.block else None
+        }
+
+
+class MiningJobManager:
+    """
+    Runs ProofOfWork.mine_block on a background thread, one job at a time,
+    and keeps recent jobs for status queries.
+    """
+
+    def __init__(self, pow_consensus, blockchain):
+        self.pow_consensus = pow_consensus
+        self.blockchain = blockchain
+        self.jobs = {}  # job id -> MiningJob, oldest first
+        self.active_job = None
+        self._lock = threading.Lock()
+
+    def start(self, miner_address):
+        """
+        Start a mining job. Returns (job, started); when a job is already
+        running, that job is returned with started=False.
+        """
+        with self._lock:
+            if self.active_job and self.active_job.status == "running":
+                return self.active_job, False
+
+            job = MiningJob(miner_address)
+            self.jobs[job.id] = job
+            self.active_job = job
+            self._forget_old_jobs()
+
+            job.thread = threading.Thread(target=self._run, args=(job,), daemon=True)
+            job.thread.start()
+            return job, True
+
+    def _run(self, job):
+        try:
+            block = self.pow_consensus.mine_block(self.blockchain, job.miner_address,
+                                                  should_stop=job.is_cancelled)
+        except Exception as e:
+            job.finish("failed", f"Mining failed: {e}")
+            return
+
+        if block:
+            job.finish("completed", "New Block Mined", block)
+        elif job.is_cancelled():
+            job.finish("cancelled", "Mining job cancelled")
+        else:
+            job.finish("failed", "Mining failed")
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.status != "running"]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Ask a running job to stop. Returns the job, or None if unknown."""
+        job = self.jobs.get(job_id)
+        if job:
+            job.cancel()
+        return job
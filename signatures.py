@@ -0,0 +1,179 @@
+"""
+Batch verification of transaction signatures.
+
+Checking a block means checking the ECDSA signature of every transfer in
+it. The curve arithmetic runs in OpenSSL, which releases the GIL while it
+works, so the signatures of a block are checked on a pool of threads: the
+transfers are cut into chunks, a few per thread, and each thread checks
+one chunk at a time. The first bad signature ends the batch: the caller
+gets its position as soon as it is found, and the other threads stop at
+their next transaction instead of finishing their chunks.
+
+Each transfer carries its sender's public key, which must hash to the
+sender's address (see keys.py); keys are loaded through a PublicKeyCache,
+so a sender's key is decompressed once rather than for every transaction.
+Rewards (sender NETWORK) are created by consensus and carry no signature.
+
+A transaction is checked when it enters the mempool and again when a block
+holding it is proposed or added. A SignatureCache remembers the (txid,
+public key) pairs that checked out, so the later checks are a dict lookup:
+the txid covers the signature and every signed field, so a hit means this
+exact transaction was already verified against this key. Only valid
+signatures are remembered, and the least recently used are dropped once
+the cache is full.
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Sequence
+from keys import PublicKeyCache, address_of
+from state import NETWORK
+
+# Chunks per thread; more chunks even out the load when some finish early
+CHUNKS_PER_WORKER = 4
+# Batches smaller than this are checked on the calling thread
+MIN_PARALLEL_BATCH = 64
+# Verified signatures remembered; about twice the default mempool size, so
+# a pool's worth stays cached until its transactions are mined
+SIGNATURE_CACHE_SIZE = 100_000
+
+
+class SignatureCache:
+    """
+    The newest `capacity` (txid, public key bytes) pairs whose signatures
+    checked out, least recently used dropped first, with counts of lookups
+    that hit and missed. Thread-safe.
+    """
+
+    def __init__(self, capacity=SIGNATURE_CACHE_SIZE):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, key) -> bool:
+        """Whether `key` was verified, counting the hit or miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, key):
+        with self._lock:
+            self._entries[key] = None
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self._entries), "capacity": self.capacity, "hits": self.hits,
+                "misses": self.misses, "hit_rate": self.hits / lookups if lookups else None}
+
+
+class SignatureVerifier:
+    """
+    Checks transaction signatures against the keys they carry, loaded
+    through `keys` (a PublicKeyCache; a new one by default), on up to
+    `workers` threads (default: one per CPU), skipping those `cache` (a
+    SignatureCache, if any) has seen verified. Thread-safe.
+    """
+
+    def __init__(self, keys: Optional[PublicKeyCache] = None, workers: Optional[int] = None,
+                 cache: Optional[SignatureCache] = None):
+        self.keys = keys if keys is not None else PublicKeyCache()
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def verify(self, tx, cached=True) -> bool:
+        """
+        Whether one transaction is a reward or carries a valid signature.
+        cached=False skips the cache lookup, for a transaction that can't
+        have been seen yet (e.g. one just submitted); a valid signature is
+        remembered either way.
+        """
+        if cached and self._known(tx):
+            return True
+        return tx.sender == NETWORK or self._check(tx)
+
+    def _known(self, tx) -> bool:
+        """Whether a transaction needs no check: a reward, or verified before."""
+        if tx.sender == NETWORK:
+            return True
+        return self.cache is not None and tx.public_key is not None \
+            and self.cache.lookup((tx.txid, tx.public_key))
+
+    def _check(self, tx) -> bool:
+        """Verify a transaction's signature, and remember it if it is valid."""
+        data = tx.public_key
+        if data is None or address_of(data) != tx.sender:
+            return False
+        public_key = self.keys.get(data)
+        if public_key is None or not tx.is_valid(public_key):
+            return False
+        if self.cache is not None:
+            self.cache.add((tx.txid, data))
+        return True
+
+    def first_invalid(self, transactions: Sequence) -> Optional[int]:
+        """
+        The position of a transaction whose signature is invalid, or None
+        if they all check out. With several bad signatures, whichever is
+        found first is reported. Rewards and cached signatures are sorted
+        out first, on the calling thread; only the rest is verified.
+        """
+        unknown = [position for position, tx in enumerate(transactions) if not self._known(tx)]
+        if self.workers == 1 or len(unknown) < MIN_PARALLEL_BATCH:
+            for position in unknown:
+                if not self._check(transactions[position]):
+                    return position
+            return None
+
+        failed = threading.Event()
+        size = -(-len(unknown) // (self.workers * CHUNKS_PER_WORKER))
+
+        def check(start):
+            for position in unknown[start:start + size]:
+                if failed.is_set():
+                    return None
+                if not self._check(transactions[position]):
+                    failed.set()
+                    return position
+            return None
+
+        pool = self._get_pool()
+        futures = [pool.submit(check, start) for start in range(0, len(unknown), size)]
+        try:
+            for future in as_completed(futures):
+                position = future.result()
+                if position is not None:
+                    return position
+            return None
+        finally:
+            # Stop the chunks still running and drop the ones not started
+            failed.set()
+            for future in futures:
+                future.cancel()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="verify")
+            return self._pool
+
+    def close(self):
+        """Stop the threads (a later batch starts them again)."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
@@ -0,0 +1,155 @@
+"""
+Account balances derived from the chain.
+
+AccountState keeps a map of address -> balance that moves forward one block
+at a time: every transfer debits its sender and credits its recipient, and
+a reward transaction (sender NETWORK) credits its recipient out of thin air.
+Senders also pay their transaction's fee, and the block's fees all go to
+the recipient of its reward (they are lost in a block without one).
+A block whose transfers would take any balance below zero is invalid.
+
+Each address also has a nonce: the nonce its next transfer must carry. A
+block must take every sender's transfers in nonce order, starting at the
+sender's current nonce and without gaps.
+
+Applying a block is split in two so a block can be checked before anything
+is written: block_changes computes the balances and nonces the block would
+leave behind (raising StateError if it is invalid), and commit installs
+them. commit returns what it overwrote, so that revert can take the block
+back out again in a reorg.
+"""
+from typing import Dict, Iterator, Optional, Tuple
+
+NETWORK = "NETWORK"
+# Reward transactions a block may carry
+MAX_REWARDS_PER_BLOCK = 1
+
+
+class StateError(ValueError):
+    """Raised for a block that is not valid against the current balances."""
+
+
+class AccountState:
+    """
+    Balances of every address that has appeared on the chain, the next
+    nonce of every address that has sent a transfer, plus the height of
+    the last block applied.
+    """
+
+    def __init__(self):
+        self.balances: Dict[str, float] = {}
+        self.nonces: Dict[str, int] = {}
+        self.height = -1
+
+    def balance(self, address: str) -> float:
+        return self.balances.get(address, 0)
+
+    def nonce(self, address: str) -> int:
+        """The nonce the address's next transfer must carry."""
+        return self.nonces.get(address, 0)
+
+    def block_changes(self, block, check=True) -> Tuple[Dict[str, float], Dict[str, int]]:
+        """
+        The new balance of every address `block` touches and the new nonce
+        of every sender, applying its transactions in order. Raises
+        StateError for a non-positive amount, a negative fee, a fee on a
+        reward, too many reward transactions, a nonce out of order or an
+        overdraft, unless `check` is False. Nothing is changed.
+        """
+        balances = self.balances
+        nonces = self.nonces
+        changes: Dict[str, float] = {}
+        nonce_changes: Dict[str, int] = {}
+        rewards = 0
+        fees = 0
+        collector = None
+        for tx in block.transactions:
+            amount = tx.amount
+            fee = tx.fee
+            if check and not amount > 0:
+                raise StateError(f"Block {block.index}: amount must be positive, got {amount!r}")
+            if check and not fee >= 0:
+                raise StateError(f"Block {block.index}: fee must not be negative, got {fee!r}")
+            if tx.sender == NETWORK:
+                rewards += 1
+                if check and rewards > MAX_REWARDS_PER_BLOCK:
+                    raise StateError(f"Block {block.index}: more than {MAX_REWARDS_PER_BLOCK} reward transaction(s)")
+                if check and fee:
+                    raise StateError(f"Block {block.index}: reward transactions can't carry a fee")
+                collector = tx.recipient
+            else:
+                sender = tx.sender
+                expected = nonce_changes[sender] if sender in nonce_changes else nonces.get(sender, 0)
+                if check and tx.nonce != expected:
+                    raise StateError(f"Block {block.index}: {sender} sent nonce {tx.nonce}, "
+                                     f"expected {expected}")
+                nonce_changes[sender] = expected + 1
+                available = changes[sender] if sender in changes else balances.get(sender, 0)
+                if check and available < amount + fee:
+                    raise StateError(f"Block {block.index}: {sender} spends {amount + fee} "
+                                     f"with a balance of {available}")
+                changes[sender] = available - amount - fee
+                fees += fee
+            recipient = tx.recipient
+            changes[recipient] = (changes[recipient] if recipient in changes else balances.get(recipient, 0)) + amount
+        if fees and collector is not None:
+            changes[collector] += fees
+        return changes, nonce_changes
+
+    def commit(self, block, changes) -> Tuple[Dict[str, Optional[float]], Dict[str, Optional[int]]]:
+        """
+        Install the balances and nonces block_changes computed for `block`.
+        Returns what they replaced (None for new addresses), for revert.
+        """
+        changes, nonce_changes = changes
+        balances = self.balances
+        nonces = self.nonces
+        previous = {address: balances.get(address) for address in changes}
+        previous_nonces = {address: nonces.get(address) for address in nonce_changes}
+        balances.update(changes)
+        nonces.update(nonce_changes)
+        self.height = block.index
+        return previous, previous_nonces
+
+    def revert(self, previous, height: int):
+        """Undo a commit, given what it returned, leaving `height` as the tip."""
+        for values, previous_values in zip((self.balances, self.nonces), previous):
+            for address, value in previous_values.items():
+                if value is None:
+                    values.pop(address, None)
+                else:
+                    values[address] = value
+        self.height = height
+
+    def apply_block(self, block):
+        """Check and apply a block in one step. Raises StateError if invalid."""
+        return self.commit(block, self.block_changes(block))
+
+    def affordable(self, transactions) -> Iterator:
+        """
+        Yield the transactions, in order, that could go into the next block:
+        each transfer must carry its sender's next nonce, and it (and its
+        fee) must be covered by its sender's balance, after the ones before
+        it. Transfers that aren't are left out, and so are the sender's
+        later ones, which would leave a gap. Lazy, so a caller can stop
+        once it has enough.
+        """
+        spendable: Dict[str, float] = {}
+        next_nonces: Dict[str, int] = {}
+        for tx in transactions:
+            amount = tx.amount
+            if tx.sender == NETWORK or not amount > 0 or not tx.fee >= 0:
+                continue
+            sender = tx.sender
+            expected = next_nonces[sender] if sender in next_nonces else self.nonces.get(sender, 0)
+            if tx.nonce != expected:
+                continue
+            available = spendable[sender] if sender in spendable else self.balances.get(sender, 0)
+            if available < amount + tx.fee:
+                continue
+            next_nonces[sender] = expected + 1
+            spendable[sender] = available - amount - tx.fee
+            recipient = tx.recipient
+            spendable[recipient] = (spendable[recipient] if recipient in spendable
+                                    else self.balances.get(recipient, 0)) + amount
+            yield tx
@@ -9,9 +9,16 @@ const bftCommitBtn = document.getElementById("bft-commit-btn");
 const posControlsElement = document.getElementById("pos-controls");
 const stakesListElement = document.getElementById("stakes-list");
 const mempoolListElement = document.getElementById("mempool-list");
+const walletListElement = document.getElementById("wallet-list");
 
 let currentValidators = []; // To store validator list
 let selectedValidator = null;
+let walletNames = {}; // address -> name of the node's wallets
+
+// A wallet's name for its address, or the address itself
+function addressLabel(address) {
+    return walletNames[address] || address;
+}
 
 function updateStatus(message, isError = false) {
     statusElement.textContent = message;
@@ -98,7 +105,8 @@ async function loadChain() {
 
         updateStatus("Blockchain loaded successfully.");
 
-        // Also load the mempool
+        // Also load the wallets (balances change with each block) and the mempool
+        await loadWallets();
         loadMempool();
 
     } catch (error) {
@@ -224,6 +232,65 @@ async function bftCommit() {
     }
 }
 
+async function loadWallets() {
+    try {
+        const response = await fetch("/wallets");
+        if (!response.ok) throw new Error("Failed to fetch wallets");
+        const data = await response.json();
+
+        const senderSelect = document.getElementById("sender");
+        const selected = senderSelect.value;
+        const names = document.getElementById("wallet-names");
+        senderSelect.innerHTML = "";
+        names.innerHTML = "";
+        walletListElement.innerHTML = "";
+        walletNames = {};
+        data.wallets.forEach(wallet => {
+            walletNames[wallet.address] = wallet.name;
+            senderSelect.add(new Option(`${wallet.name} (${wallet.balance})`, wallet.name));
+            names.appendChild(new Option(wallet.name));
+
+            const walletElement = document.createElement("div");
+            walletElement.classList.add("wallet-entry");
+            walletElement.textContent = `${wallet.name}: ${wallet.balance} (${wallet.address})`;
+            walletListElement.appendChild(walletElement);
+        });
+        if (selected) senderSelect.value = selected;
+        if (data.wallets.length === 0) {
+            walletListElement.innerHTML = "<p><small>No wallets yet.</small></p>";
+        }
+    } catch (error) {
+        console.error("Error loading wallets:", error);
+        walletListElement.innerHTML = `<p><small style="color: red;">Error loading wallets: ${error.message}</small></p>`;
+    }
+}
+
+async function createWallet() {
+    const name = document.getElementById("wallet-name").value.trim();
+    if (!name) {
+        updateStatus("Please enter a wallet name.", true);
+        return;
+    }
+
+    try {
+        const response = await fetch("/wallets/new", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ name })
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || `HTTP error! status: ${response.status}`);
+        }
+        updateStatus(response.status === 201 ? `Wallet ${name} created.` : `Wallet ${name} already exists.`);
+        document.getElementById("wallet-name").value = '';
+        loadWallets();
+    } catch (error) {
+        console.error("Failed to create wallet:", error);
+        updateStatus("Error creating wallet: " + error.message, true);
+    }
+}
+
 async function createTransaction() {
     const sender = document.getElementById("sender").value;
     const recipient = document.getElementById("recipient").value;
@@ -242,11 +309,10 @@ async function createTransaction() {
         });
         const data = await response.json();
         if (!response.ok) {
-            throw new Error(data.message || `HTTP error! status: ${response.status}`);
+            throw new Error(data.error || data.message || `HTTP error! status: ${response.status}`);
         }
         updateStatus(data.message);
-        // Clear input fields after successful submission
-        document.getElementById("sender").value = '';
+        // Clear input fields after successful submission (the sender stays selected)
         document.getElementById("recipient").value = '';
         document.getElementById("amount").value = '';
 
@@ -259,24 +325,62 @@ async function createTransaction() {
     }
 }
 
+let currentMiningJob = null;
+
 async function mineBlock() {
-    updateStatus("Mining block... (This might take a moment)");
+    updateStatus("Mining block in the background...");
     try {
-        // Add a dummy query param to easily identify the miner if needed later
-        const response = await fetch("/mine?miner=web_ui"); 
+        // Rewards go to the node's default wallet, miner_node
+        const response = await fetch("/mine", { method: "POST" });
         const data = await response.json();
-         if (!response.ok) {
-            throw new Error(data.message || `HTTP error! status: ${response.status}`);
+        if (!response.ok && response.status !== 409) {
+            throw new Error(data.error || data.message || `HTTP error! status: ${response.status}`);
         }
-        updateStatus(data.message + (data.block ? ` Block Index: ${data.block.index}` : ''));
-        loadChain(); // Refresh the chain view
-        loadMempool(); // Refresh the mempool view (should be empty now)
+        currentMiningJob = data.job.id;
+        pollMiningJob(currentMiningJob);
     } catch (error) {
         console.error("Mining failed:", error);
         updateStatus("Mining failed: " + error.message, true);
     }
 }
 
+async function pollMiningJob(jobId) {
+    try {
+        const response = await fetch(`/mine/jobs/${jobId}`);
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.error || `HTTP error! status: ${response.status}`);
+
+        const job = data.job;
+        if (job.status === "running") {
+            setTimeout(() => pollMiningJob(jobId), 500);
+            return;
+        }
+        currentMiningJob = null;
+        updateStatus(job.message + (job.block ? ` Block Index: ${job.block.index}` : ''), job.status === "failed");
+        loadChain(); // Refresh the chain view
+        loadMempool(); // Refresh the mempool view (should be empty now)
+    } catch (error) {
+        console.error("Mining job status failed:", error);
+        updateStatus("Mining job status failed: " + error.message, true);
+    }
+}
+
+async function cancelMining() {
+    if (!currentMiningJob) {
+        updateStatus("No mining job is running", true);
+        return;
+    }
+    try {
+        const response = await fetch(`/mine/jobs/${currentMiningJob}/cancel`, { method: "POST" });
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.error || `HTTP error! status: ${response.status}`);
+        updateStatus(data.message);
+    } catch (error) {
+        console.error("Cancel mining failed:", error);
+        updateStatus("Cancel mining failed: " + error.message, true);
+    }
+}
+
 async function bftNextRound() {
     updateStatus("Running BFT consensus round...");
     try {
@@ -490,7 +594,7 @@ async function loadMempool() {
                 const txElement = document.createElement("div");
                 txElement.classList.add("mempool-tx");
                 // Basic display, could be more detailed
-                txElement.textContent = `From: ${tx.sender}, To: ${tx.recipient}, Amount: ${tx.amount}`;
+                txElement.textContent = `From: ${addressLabel(tx.sender)}, To: ${addressLabel(tx.recipient)}, Amount: ${tx.amount}`;
                 mempoolListElement.appendChild(txElement);
             });
         } else {
@@ -0,0 +1,56 @@
+"""
+Block templates: the next block, filled from the mempool.
+
+PoW, BFT and PoS all build their blocks here. Transactions are taken from
+the mempool best fee rate first, each sender's as a contiguous run of
+nonces from its next one on the chain, skipping transfers their senders
+can't pay for (and the rest of their run), and the block's encoded size is
+added up as each one goes in (the mempool already knows every
+transaction's size). Selection stops at the
+first transaction that would take the block past MAX_BLOCK_SIZE; it and
+everything after it stay in the mempool for a later block. Building a
+template costs the number of transactions it takes, not the size of the
+mempool.
+"""
+import time
+from typing import Optional, Sequence
+from blockchain import Block, Transaction, MAX_BLOCK_SIZE
+from codec import block_overhead
+
+
+def build_block(blockchain, consensus_method: str, reward: Optional[Transaction] = None,
+                signers: Sequence[str] = (), max_size: int = MAX_BLOCK_SIZE, **fields) -> Block:
+    """
+    The next block for `blockchain`, holding as many pending transactions
+    as fit in `max_size` bytes with room left for `reward` (appended last)
+    and for the names of `signers`, for blocks that collect signatures after
+    they are built. `fields` are passed on to Block (e.g. bits).
+    """
+    with blockchain.lock:
+        last_block = blockchain.get_last_block()
+        budget = max_size - block_overhead(consensus_method, signers)
+        if reward is not None:
+            budget -= len(reward.to_bytes())
+        if budget < 0:
+            raise ValueError(f"A {consensus_method} block can't fit in {max_size} bytes")
+
+        mempool = blockchain.mempool
+        entries = mempool.entries
+        transactions = []
+        for tx in blockchain.state.affordable(mempool.by_priority()):
+            size = entries[tx.txid].size
+            if size > budget:
+                break
+            budget -= size
+            transactions.append(tx)
+        if reward is not None:
+            transactions.append(reward)
+
+        return Block(
+            index=len(blockchain.chain),
+            transactions=transactions,
+            timestamp=time.time(),
+            previous_hash=last_block.hash,
+            consensus_method=consensus_method,
+            **fields
+        )
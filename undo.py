@@ -0,0 +1,66 @@
+"""
+Undo records for rolling the chain back.
+
+Adding a block moves the state derived from the chain forward: balances,
+the address history and the difficulty window. To switch to a competing
+branch, those have to move back to the fork point. Rather than rebuild
+them from genesis, every block added leaves a BlockUndo behind holding just
+what it overwrote, and disconnecting the block puts that back.
+
+- balances: the balance each touched address had before the block (None
+  for an address the block created)
+- nonces: the same for the nonce of each address that sent a transfer
+- difficulty: the DifficultyAdjuster snapshot taken before a PoW block was
+  observed (None for other blocks)
+
+The address history needs no record: a block's entries are the last ones
+for each of its addresses, and the block itself says which those are.
+
+Only the newest `depth` records are kept, which bounds how deep a reorg
+can go.
+"""
+from collections import deque
+from typing import Dict, Optional
+
+UNDO_DEPTH = 100
+
+
+class ReorgError(Exception):
+    """Raised when the chain can't be rolled back to the requested height."""
+
+
+class BlockUndo:
+    __slots__ = ('height', 'balances', 'nonces', 'difficulty')
+
+    def __init__(self, height: int, balances: Dict[str, Optional[float]],
+                 nonces: Dict[str, Optional[int]], difficulty=None):
+        self.height = height
+        self.balances = balances
+        self.nonces = nonces
+        self.difficulty = difficulty
+
+
+class UndoLog:
+    """The undo records of the newest `depth` blocks, oldest first."""
+
+    def __init__(self, depth=UNDO_DEPTH):
+        self.depth = depth
+        self.records = deque(maxlen=depth)
+
+    def __len__(self):
+        return len(self.records)
+
+    def push(self, record: BlockUndo):
+        if self.depth:
+            self.records.append(record)
+
+    def can_undo_to(self, height: int, tip: int) -> bool:
+        """Whether every block above `height`, up to `tip`, has a record."""
+        return height >= tip or (bool(self.records) and self.records[0].height <= height + 1
+                                 and self.records[-1].height == tip)
+
+    def pop(self, height: int) -> BlockUndo:
+        """The record of the block at `height`, which must be the newest."""
+        if not self.records or self.records[-1].height != height:
+            raise ReorgError(f"No undo record for block {height}")
+        return self.records.pop()
@@ -0,0 +1,105 @@
+"""
+Custodial wallets for the demo node.
+
+The node holds a private key for each wallet and signs transfers for it, so
+the web UI can send from a wallet by name without handling keys. A
+wallet's address is derived from its key (see keys.py), like any other.
+With a directory, each wallet's key is kept there as <name>.pem and the
+wallets are loaded again on startup.
+
+Real users hold their own keys and post transactions already signed, with
+their public key attached.
+"""
+import os
+import re
+import threading
+from typing import Dict, Iterator, Optional
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from keys import public_key_bytes, address_of, is_address
+
+WALLET_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}$")
+
+
+class Wallet:
+    __slots__ = ('name', 'private_key', 'public_key', 'address', 'lock')
+
+    def __init__(self, name, private_key):
+        self.name = name
+        self.lock = threading.Lock()  # held while a transfer from the wallet is submitted
+        self.private_key = private_key
+        self.public_key = public_key_bytes(private_key.public_key())
+        self.address = address_of(self.public_key)
+
+    def sign(self, tx):
+        """Sign a transaction sent from this wallet."""
+        tx.sign_transaction(self.private_key)
+
+    def to_dict(self):
+        return {"name": self.name, "address": self.address, "public_key": self.public_key.hex()}
+
+
+class Wallets:
+    """The node's wallets by name and by address. Thread-safe."""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self._by_name: Dict[str, Wallet] = {}
+        self._by_address: Dict[str, Wallet] = {}
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            for filename in sorted(os.listdir(directory)):
+                name, extension = os.path.splitext(filename)
+                if extension != ".pem" or not WALLET_NAME.match(name):
+                    continue
+                with open(os.path.join(directory, filename), "rb") as f:
+                    self._add(Wallet(name, serialization.load_pem_private_key(f.read(), password=None)))
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def __iter__(self) -> Iterator[Wallet]:
+        with self._lock:
+            return iter(list(self._by_name.values()))
+
+    def get(self, name: str) -> Optional[Wallet]:
+        return self._by_name.get(name)
+
+    def by_address(self, address: str) -> Optional[Wallet]:
+        return self._by_address.get(address)
+
+    def create(self, name: str) -> Wallet:
+        """The wallet called `name`, created with a new key if there is none."""
+        if not WALLET_NAME.match(name):
+            raise ValueError("Wallet names are 1-64 letters, digits, '_' or '-'")
+        with self._lock:
+            wallet = self._by_name.get(name)
+            if wallet is not None:
+                return wallet
+            private_key = ec.generate_private_key(ec.SECP256R1())
+            if self.directory is not None:
+                # Readable by the node's user only
+                path = os.path.join(self.directory, name + ".pem")
+                with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+                    f.write(private_key.private_bytes(serialization.Encoding.PEM,
+                                                      serialization.PrivateFormat.PKCS8,
+                                                      serialization.NoEncryption()))
+            wallet = Wallet(name, private_key)
+            self._add(wallet)
+            return wallet
+
+    def resolve(self, value: str) -> Optional[str]:
+        """
+        The address `value` stands for: itself if it has the form of an
+        address, else the address of the wallet of that name, or None if
+        there is no such wallet. Never creates a wallet.
+        """
+        if is_address(value):
+            return value
+        wallet = self._by_name.get(value)
+        return wallet.address if wallet is not None else None
+
+    def _add(self, wallet: Wallet):
+        self._by_name[wallet.name] = wallet
+        self._by_address[wallet.address] = wallet